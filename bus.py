@@ -0,0 +1,122 @@
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import dbus
+from dbus.mainloop.glib import DBusGMainLoop, threads_init
+from gi.repository import GLib
+
+
+class Service:
+
+    def __init__(self, name, path, batched=()):
+        threads_init()
+        try:
+            self.bus = dbus.SessionBus(mainloop=DBusGMainLoop())
+            bus_obj = self.bus.get_object(name, path)
+            self.interface = dbus.Interface(bus_obj, name)
+        except dbus.DBusException as e:
+            sys.exit(e)
+
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.recorder = None
+        self.loop = None
+        self.run_signal = None
+
+        self.batched = batched
+        self.queue = []
+        self.messages = 0
+        self.calls_batched = 0
+
+    def __getattr__(self, method):
+        def call(*args):
+            return self.call(method, *args)
+        return call
+
+    def start(self, loop, run_signal=None):
+        self.loop = loop
+        self.run_signal = run_signal
+        threading.Thread(target=GLib.MainLoop().run, daemon=True).start()
+
+    def connect_signal(self, signal, handler):
+        def receive(*args):
+            self.loop.call_soon_threadsafe(self.dispatch, signal, handler,
+                                           args)
+        self.interface.connect_to_signal(signal, receive)
+
+    def dispatch(self, signal, handler, args):
+        if self.recorder:
+            self.recorder.signal(signal, args)
+        if self.run_signal is not None:
+            self.run_signal(handler, args)
+        else:
+            handler(*args)
+            self.flush()
+
+    def call(self, method, *args):
+        if method in self.batched:
+            self.queue.append((method, args))
+            return None
+
+        self.flush()
+        self.messages += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor, getattr(self.interface, method), *args
+        )
+
+        def done(future):
+            if future.cancelled():
+                return
+            elif future.exception():
+                print(future.exception())
+            elif self.recorder:
+                self.recorder.reply(method, future.result())
+
+        future.add_done_callback(done)
+        return future
+
+    def close(self):
+        # Calls sent with ignore_reply may still sit in the connection's
+        # outgoing buffer once the executor is done.
+        self.flush()
+        self.executor.shutdown(wait=True)
+        self.bus.flush()
+
+    def flush(self):
+        if self.queue:
+            self.messages += 1
+            self.calls_batched += len(self.queue) - 1
+            self.executor.submit(self.send, self.queue)
+            self.queue = []
+
+    def send(self, queue):
+        try:
+            if len(queue) == 1:
+                method, args = queue[0]
+                getattr(self.interface, method)(*args, ignore_reply=True)
+            else:
+                operations = []
+                for method, args in queue:
+                    operations.append((method, [variant(a) for a in args]))
+                self.interface.batch(operations, ignore_reply=True)
+        except dbus.DBusException as e:
+            print(e)
+
+
+def has_owner(name):
+    try:
+        bus = dbus.SessionBus(private=True)
+    except dbus.DBusException:
+        return False
+    try:
+        return bool(bus.name_has_owner(name))
+    finally:
+        bus.close()
+
+
+def variant(value):
+    if isinstance(value, list):
+        return dbus.Array(value, signature="s")
+    return value
@@ -3,12 +3,10 @@
 import os
 import subprocess
 import sys
-import fcntl
-import select
 
 import gi
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Pango, Gdk
+from gi.repository import Gtk, Pango, Gdk, GObject, GLib
 
 import dbus
 import dbus.service
@@ -19,6 +17,23 @@ import grid
 
 RDY_MSG = "READY"
 
+batch_methods = (
+    "append_tab",
+    "remove_frame",
+    "remove_tab",
+    "set_tab_name",
+    "set_tab_icon",
+    "toggle_decorations",
+    "change_tab_position_next",
+    "change_tab_position_prev",
+    "goto_tab",
+    "remove_color",
+    "set_header_color",
+    "set_focused_frame",
+    "show_grid",
+    "hide_grid"
+)
+
 
 class DBusService(dbus.service.Object):
 
@@ -28,6 +43,9 @@ class DBusService(dbus.service.Object):
 
         self.application = application
         self.frames = {}
+        self.owners = {}
+        self.pages = {}
+        self.focused = None
         self.cp = Gtk.CssProvider()
         self.colors = {}
         self.dark = {}
@@ -44,18 +62,67 @@ class DBusService(dbus.service.Object):
 
         self.terminals = ["termite", "xterm", "urxvt"]
 
+        self.pool = []
+        self.pool_size = 2
+        self.filling = False
+        self.fill_pool()
+
+    @dbus.service.method("org.wm.Frames", in_signature="a(sav)")
+    def batch(self, operations):
+        for method, args in operations:
+            if method in batch_methods:
+                try:
+                    getattr(self, method)(*args)
+                except Exception as e:
+                    print(e, file=sys.stderr)
+
     @dbus.service.method("org.wm.Frames")
     def append_frame(self):
-        frame = Frame()
+        if self.pool:
+            frame = self.pool.pop()
+        else:
+            frame = self.create_frame()
+        frame.show()
+        self.frames[frame.fid] = frame
+        self.fill_pool()
+        return frame.fid
+
+    def create_frame(self):
+        frame = Frame(self.owners, self.pages)
         self.application.add_window(frame)
-        frame.show_all()
-        fid = frame.get_window().get_xid()
-        self.frames[fid] = frame
-        return fid
+        frame.notebook.show_all()
+        frame.realize()
+        frame.fid = frame.get_window().get_xid()
+        frame.connect("tab-moved", self.frame_tab_moved)
+        return frame
+
+    def fill_pool(self):
+        if not self.filling and len(self.pool) < self.pool_size:
+            self.filling = True
+            GLib.idle_add(self.fill_pool_idle)
+
+    def fill_pool_idle(self):
+        if len(self.pool) < self.pool_size:
+            self.pool.append(self.create_frame())
+        self.filling = len(self.pool) < self.pool_size
+        return self.filling
 
     @dbus.service.method("org.wm.Frames")
     def remove_frame(self, fid):
-        self.frames[fid].close()
+        frame = self.frames.pop(fid)
+        for wid in list(frame.windows):
+            frame.notebook.remove_page(
+                    frame.notebook.page_num(frame.windows[wid]))
+            frame.remove_tab(wid)
+        if fid == self.focused:
+            self.focused = None
+
+        if len(self.pool) < self.pool_size:
+            frame.hide()
+            frame.reset()
+            self.pool.append(frame)
+        else:
+            frame.close()
 
     @dbus.service.method("org.wm.Frames")
     def send_fid(self, fid):
@@ -114,6 +181,17 @@ class DBusService(dbus.service.Object):
             frame.show_all()
             frame.notebook.set_current_page(frame.notebook.page_num(window))
 
+    def frame_tab_moved(self, frame, source, wid):
+        self.tab_moved(source.fid, frame.fid, wid)
+
+    @dbus.service.signal("org.wm.Frames", signature="uuu")
+    def tab_moved(self, fid, fid2, wid):
+        pass
+
+    @dbus.service.signal("org.wm.Frames", signature="uu")
+    def tab_closed(self, fid, wid):
+        pass
+
     def tab_hover(self, box, ec):
         box.set_name("hover")
 
@@ -123,30 +201,18 @@ class DBusService(dbus.service.Object):
 
     def tab_pressed(self, sender, event, wid):
         if event.button == 2:
-            frame = None
-            for fid in self.frames:
-                if wid in self.frames[fid].labels:
-                    frame = self.frames[fid]
-                    break
-
-            if frame:
-                frame.iconify()
-                frame.notebook.remove_page(
-                        frame.notebook.page_num(frame.windows[wid]))
-                frame.remove_tab(wid)
+            self.close_tab(wid)
 
     def close_button_clicked(self, sender, wid):
-        frame = None
-        for fid in self.frames:
-            if wid in self.frames[fid].labels:
-                frame = self.frames[fid]
-                break
+        self.close_tab(wid)
 
+    def close_tab(self, wid):
+        frame = self.owners.get(wid)
         if frame:
-            frame.iconify()
             frame.notebook.remove_page(
                     frame.notebook.page_num(frame.windows[wid]))
             frame.remove_tab(wid)
+            self.tab_closed(frame.fid, wid)
 
     @dbus.service.method("org.wm.Frames")
     def toggle_decorations(self, fid):
@@ -208,9 +274,7 @@ class DBusService(dbus.service.Object):
         if fid in self.frames:
             frame = self.frames[fid]
             active = frame.notebook.get_current_page()
-            for wid in frame.windows:
-                if frame.notebook.page_num(frame.windows[wid]) == active:
-                    return wid
+            return self.pages.get(frame.notebook.get_nth_page(active), 0)
         return 0
 
     @dbus.service.method("org.wm.Frames")
@@ -252,12 +316,8 @@ class DBusService(dbus.service.Object):
         else:
             notebook.next_page()
 
-        for wid in frame.windows:
-            if frame.windows[wid] == notebook.get_nth_page(
-                    notebook.get_current_page()):
-                return wid
-
-        return 0
+        return self.pages.get(
+                notebook.get_nth_page(notebook.get_current_page()), 0)
 
     @dbus.service.method("org.wm.Frames")
     def prev_tab(self, fid):
@@ -269,12 +329,8 @@ class DBusService(dbus.service.Object):
         else:
             notebook.prev_page()
 
-        for wid in frame.windows:
-            if frame.windows[wid] == notebook.get_nth_page(
-                    notebook.get_current_page()):
-                return wid
-
-        return 0
+        return self.pages.get(
+                notebook.get_nth_page(notebook.get_current_page()), 0)
 
     @dbus.service.method("org.wm.Frames")
     def goto_tab_num(self, fid, n):
@@ -283,16 +339,12 @@ class DBusService(dbus.service.Object):
 
         if n < notebook.get_n_pages():
             notebook.set_current_page(n)
-            for wid in frame.windows:
-                if frame.windows[wid] == notebook.get_nth_page(n):
-                    return wid
+            return self.pages.get(notebook.get_nth_page(n), 0)
 
         return 0
 
     @dbus.service.method("org.wm.Frames")
     def get_wids(self):
-        self.check_changes()
-
         frames = {}
         for fid in self.frames:
             wids = []
@@ -308,42 +360,6 @@ class DBusService(dbus.service.Object):
         else:
             return None
 
-    def check_changes(self):
-        missing = {}
-        for fid in self.frames:
-            notebook_windows = []
-            for i in range(self.frames[fid].notebook.get_n_pages()):
-                notebook_windows.append(self.frames[fid].notebook
-                                        .get_nth_page(i))
-
-            frame_windows = []
-            for wid in self.frames[fid].windows:
-                frame_windows.append(self.frames[fid].windows[wid])
-
-            missing = [w for w in notebook_windows if w not in frame_windows]
-            if len(missing) > 0:
-                missing = missing[0]
-                fid2 = 0
-                for f2 in self.frames:
-                    for w in self.frames[f2].windows:
-                        if self.frames[f2].windows[w] == missing:
-                            wid = w
-                            fid2 = f2
-
-                if fid2 != 0:
-                    frame = self.frames[fid]
-                    frame2 = self.frames[fid2]
-
-                    frame.labels[wid] = frame2.labels[wid]
-                    frame.windows[wid] = frame2.windows[wid]
-                    frame.tabs[wid] = frame2.tabs[wid]
-                    frame.icons[wid] = frame2.icons[wid]
-
-                    del frame2.labels[wid]
-                    del frame2.windows[wid]
-                    del frame2.tabs[wid]
-                    del frame2.icons[wid]
-
     @dbus.service.method("org.wm.Frames")
     def add_color(self, fid, wid, classlist, color):
         if classlist:
@@ -412,6 +428,14 @@ class DBusService(dbus.service.Object):
         else:
             notebook.set_name("")
 
+    @dbus.service.method("org.wm.Frames")
+    def set_focused_frame(self, fid):
+        if fid != self.focused:
+            if self.focused in self.frames:
+                self.set_header_color(self.focused, False)
+            self.set_header_color(fid, True)
+            self.focused = fid
+
     @dbus.service.method("org.wm.Frames")
     def show_grid(self):
         self.grid.show_image(True)
@@ -423,7 +447,11 @@ class DBusService(dbus.service.Object):
 
 class Frame(Gtk.Window):
 
-    def __init__(self):
+    __gsignals__ = {
+        "tab-moved": (GObject.SignalFlags.RUN_FIRST, None, (object, int))
+    }
+
+    def __init__(self, owners, pages):
         Gtk.Window.__init__(self)
 
         screen = self.get_screen()
@@ -436,8 +464,12 @@ class Frame(Gtk.Window):
         self.notebook = Gtk.Notebook()
         self.notebook.set_scrollable(True)
         self.notebook.set_name("")
+        self.notebook.connect("page-added", self.page_added)
         self.add(self.notebook)
 
+        self.fid = 0
+        self.owners = owners
+        self.pages = pages
         self.windows = {}
         self.tabs = {}
         self.labels = {}
@@ -445,18 +477,39 @@ class Frame(Gtk.Window):
 
         self.fullscreen = False
 
+    def reset(self):
+        self.notebook.set_name("")
+        if self.fullscreen:
+            self.notebook.show()
+            self.fullscreen = False
+
     def append_tab(self, wid, window, tab, label, icon):
         self.windows[wid] = window
         self.tabs[wid] = tab
         self.labels[wid] = label
         self.icons[wid] = icon
+        self.owners[wid] = self
+        self.pages[window] = wid
 
     def remove_tab(self, wid):
+        if self.owners.get(wid) is self:
+            del self.owners[wid]
+            del self.pages[self.windows[wid]]
         del self.windows[wid]
         del self.tabs[wid]
         del self.labels[wid]
         del self.icons[wid]
 
+    def page_added(self, notebook, page, num):
+        wid = self.pages.get(page)
+        owner = self.owners.get(wid)
+        if owner is not None and owner is not self:
+            tab = (owner.windows[wid], owner.tabs[wid], owner.labels[wid],
+                   owner.icons[wid])
+            owner.remove_tab(wid)
+            self.append_tab(wid, *tab)
+            self.emit("tab-moved", owner, wid)
+
 
 class Application(Gtk.Application):
 
@@ -483,19 +536,24 @@ class Application(Gtk.Application):
 
 
 def run():
-    process = subprocess.Popen(["python3", __file__], stdout=subprocess.PIPE)
-    fcntl.fcntl(
-        process.stdout.fileno(), fcntl.F_SETFL,
-        fcntl.fcntl(process.stdout.fileno(), fcntl.F_GETFL) | os.O_NONBLOCK
-    )
-
-    while not process.poll():
-        if select.select([process.stdout.fileno()], [], [])[0]:
-            if process.stdout.read().decode("UTF-8") == RDY_MSG:
-                break
+    ready, write = os.pipe()
+    subprocess.Popen(["python3", __file__, str(write)], pass_fds=[write])
+    os.close(write)
+    return ready
+
+
+def wait(ready):
+    if ready is not None:
+        if os.read(ready, len(RDY_MSG)).decode("UTF-8") != RDY_MSG:
+            print("Decorations exited before they were ready")
+        os.close(ready)
 
 
 if __name__ == "__main__":
+    ready = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    if ready is not None:
+        os.set_inheritable(ready, False)
+
     os.environ["GTK_THEME"] = "Adwaita"
 
     application = Application()
@@ -503,7 +561,8 @@ if __name__ == "__main__":
     DBusGMainLoop(set_as_default=True)
     DBusService(application)
 
-    sys.stdout.write(RDY_MSG)
-    sys.stdout.flush()
+    if ready is not None:
+        os.write(ready, RDY_MSG.encode("UTF-8"))
+        os.close(ready)
 
     application.run(None)
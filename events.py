@@ -1,79 +1,301 @@
 
 from xcffib.xproto import ButtonPressEvent, ConfigureRequestEvent, \
     DestroyNotifyEvent, KeyPressEvent, MapNotifyEvent, MapRequestEvent, \
-    PropertyNotifyEvent, WindowError, ClientMessageEvent, ButtonIndex, \
+    PropertyNotifyEvent, WindowError, ButtonIndex, \
     ModMask, ButtonReleaseEvent, MotionNotifyEvent, EventMask, \
-    EnterNotifyEvent
+    EnterNotifyEvent, ConfigureNotifyEvent
+
+import asyncio
+import time
+
+import xcffib
+from xcffib.randr import NotifyEvent, ScreenChangeNotifyEvent
 
 import x
 import wm
+import tracing
 from util import parse_keybinds
 
 
+window_events = (
+    MapRequestEvent, MapNotifyEvent, ConfigureRequestEvent,
+    ConfigureNotifyEvent, PropertyNotifyEvent
+)
+
+output_events = (ScreenChangeNotifyEvent, NotifyEvent)
+
+
 class EventHandler:
 
-    def __init__(self, layouts, keybinds):
-        self.conn = x.Connection()
+    def __init__(self, layouts, keybinds, conn=None, decorations=None):
+        # The decorations process boots while the X setup runs and is only
+        # waited for once the window manager needs it.
+        self.startup_phases = []
+        self.phase_start = time.perf_counter()
+        ready = None
+        if decorations is None:
+            ready = wm.start_decorations()
+        self.phase("spawn decorations")
+
+        live = conn is None
+        if live:
+            conn = x.Connection()
+        self.conn = conn
+        self.phase("connect")
+
+        self.conn.begin_batch()
         self.wm = wm.WindowManager(self.conn, layouts)
         self.kb = parse_keybinds(self.conn, self.wm, keybinds)
+        self.conn.end_batch()
+        self.phase("x setup")
+
+        self.wm.connect_decorations(decorations, ready)
+        self.phase("wait for decorations")
+
+        if live:
+            self.conn.begin_batch()
+            self.wm.load_state(ready is None)
+            self.conn.end_batch()
+        self.phase("restore")
+
+        self.startup_time = sum(t for _, t in self.startup_phases)
         self.sleep_time = 0.1
+        self.batch = True
+        self.flushes_saved = {}
+        self.events_coalesced = 0
+        self.motions = {}
+        self.prev_time = 0
+        self.names = ["WM_{}NAME", "_NET_WM_{}NAME", "_NET_WM_VISIBLE_{}NAME"]
+        self.recorder = None
+        self.drag_timer = None
+
+    def phase(self, name):
+        now = time.perf_counter()
+        self.startup_phases.append((name, now - self.phase_start))
+        self.phase_start = now
+
+    def record(self, path):
+        self.recorder = tracing.Recorder(path, self.conn)
+        self.wm.decorations.recorder = self.recorder
 
     def run(self):
-        prev_time = 0
+        print("Startup took {:.1f} ms".format(self.startup_time * 1000))
+        for name, elapsed in self.startup_phases:
+            print("  {:<22} {:>8.1f} ms".format(name, elapsed * 1000))
+        asyncio.run(self.main())
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        self.done = loop.create_future()
+        self.wm.decorations.start(loop, self.run_signal)
+        self.wm.launcher.start()
+        loop.add_reader(self.conn.get_file_descriptor(), self.process_events)
+        self.process_events()
+        try:
+            await self.done
+        finally:
+            loop.remove_reader(self.conn.get_file_descriptor())
+
+    def process_events(self):
+        try:
+            events = self.coalesce(self.get_events())
+            while events:
+                self.handle_events(events)
+                events = self.coalesce(self.get_events())
+        except xcffib.ConnectionException as e:
+            if not self.done.done():
+                self.done.set_exception(e)
 
-        pn_atoms = self.conn.get_atoms([
-            "WM_NAME", "_NET_WM_NAME", "_NET_WM_VISIBLE_NAME",
-            "WM_ICON_NAME", "_NET_WM_ICON_NAME", "_NET_WM_VISIBLE_ICON_NAME",
-            "WM_NORMAL_HINTS", "_NET_WM_USER_TIME"
-        ])
-        names = ["WM_{}NAME", "_NET_WM_{}NAME", "_NET_WM_VISIBLE_{}NAME"]
+    def handle_events(self, events):
+        if self.batch:
+            self.conn.begin_batch()
+        last = None
+        try:
+            for event in events:
+                requests = self.conn.flush_requests
+                flushes = self.conn.flushes
+                name = type(event).__name__
+                try:
+                    self.handle_event(event)
+                except WindowError as e:
+                    print(e)
+                if self.conn.deferred:
+                    requested = self.conn.flush_requests - requests
+                    saved = requested - (self.conn.flushes - flushes)
+                    self.flushes_saved[name] = \
+                        self.flushes_saved.get(name, 0) + saved
+                    if requested and self.conn.pending:
+                        last = name
+        finally:
+            flushes = self.conn.flushes
+            self.conn.end_batch()
+        # The flush the batch still does is charged to the last event
+        # that left requests pending.
+        if last is not None and self.conn.flushes > flushes:
+            self.flushes_saved[last] -= 1
+        self.wm.decorations.flush()
+        if self.drag_timer is None:
+            self.commit_drag()
 
+    def commit_drag(self):
+        self.drag_timer = None
+        if self.batch:
+            self.conn.begin_batch()
+        try:
+            self.schedule_drag(self.wm.commit_drag())
+        except WindowError as e:
+            print(e)
+        finally:
+            self.conn.end_batch()
+        self.wm.decorations.flush()
+
+    def run_signal(self, handler, args):
+        # Handlers may read replies, which can move queued events into
+        # xcb's own queue where the fd reader no longer sees them.
+        if self.batch:
+            self.conn.begin_batch()
+        try:
+            handler(*args)
+        except WindowError as e:
+            print(e)
+        finally:
+            self.conn.end_batch()
+        self.wm.decorations.flush()
+        self.process_events()
+
+    def schedule_drag(self, delay):
+        if delay is not None:
+            self.drag_timer = asyncio.get_running_loop().call_later(
+                delay, self.commit_drag)
+
+    def spawn(self, result):
+        if asyncio.iscoroutine(result):
+            task = asyncio.ensure_future(result)
+            task.add_done_callback(self.task_done)
+            return task
+        return None
+
+    def task_done(self, task):
+        if not task.cancelled() and task.exception():
+            print(task.exception())
+        self.wm.decorations.flush()
+        self.process_events()
+
+    def get_events(self):
+        events = []
         while True:
             try:
-                event = self.conn.get_next_event()
-                if isinstance(event, MapRequestEvent):
-                    self.wm.map_request(event.window)
-                elif isinstance(event, DestroyNotifyEvent):
-                    self.wm.close_tab(event.window)
-                elif isinstance(event, ConfigureRequestEvent):
-                    self.wm.configure(event)
-                elif isinstance(event, KeyPressEvent):
-                    if event.time - prev_time > self.sleep_time * 1000:
-                        code = event.detail
-                        mods = event.state
-                        if self.kb and code in self.kb \
-                                and mods in self.kb[code]:
-                            self.kb[code][mods][0](*self.kb[code][mods][1:])
-                        prev_time = event.time
-                elif isinstance(event, ButtonPressEvent):
-                    self.wm.focus_frame(event.child)
-                    self.wm.button_press(event)
-                    self.conn.replay_pointer(event.time)
-                elif isinstance(event, MotionNotifyEvent):
-                    self.wm.button_motion(event)
-                    self.conn.replay_pointer(event.time)
-                elif isinstance(event, ButtonReleaseEvent):
-                    self.wm.button_release(event)
-                    self.conn.replay_pointer(event.time)
-                elif isinstance(event, PropertyNotifyEvent):
-                    if event.atom == pn_atoms["WM_NORMAL_HINTS"]:
-                        self.wm.handle_property_normal_hints(event.window)
-                    elif event.atom == pn_atoms["_NET_WM_USER_TIME"]:
-                        self.wm.update_tab_order(event.window)
-                    else:
-                        for n in names:
-                            if event.atom == pn_atoms[n.format("")]:
-                                self.wm.set_name(event.window)
-                                break
-                            elif event.atom == pn_atoms[n.format("ICON_")]:
-                                self.wm.set_icon_name(event.window)
-                                break
-                elif isinstance(event, ClientMessageEvent):
-                    self.wm.check_tab_amount(event)
-                elif isinstance(event, EnterNotifyEvent):
-                    self.wm.enter_window(event)
-                elif isinstance(event, MapNotifyEvent):
-                    pass
-
+                event = self.conn.poll_next_event()
             except WindowError as e:
                 print(e)
+                continue
+            if event is None:
+                break
+            if self.recorder:
+                self.recorder.event(event)
+            events.append(event)
+
+        if events and self.recorder:
+            self.recorder.batch()
+
+        return events
+
+    def coalesce(self, events):
+        destroyed = {}
+        for i, event in enumerate(events):
+            if isinstance(event, DestroyNotifyEvent):
+                destroyed[event.window] = i
+
+        kept = []
+        properties = set()
+        # Raw motions each kept MotionNotify stands for, so drag statistics
+        # still see every motion received.
+        self.motions = {}
+        motion = None
+        enter = False
+        output = False
+        for i in range(len(events) - 1, -1, -1):
+            event = events[i]
+            if isinstance(event, (ButtonPressEvent, ButtonReleaseEvent)):
+                motion = None
+                enter = False
+            elif isinstance(event, MotionNotifyEvent):
+                if motion is not None:
+                    self.motions[id(motion)] += 1
+                    continue
+                motion = event
+                self.motions[id(motion)] = 1
+            elif isinstance(event, EnterNotifyEvent):
+                if enter:
+                    continue
+                enter = True
+            elif isinstance(event, PropertyNotifyEvent):
+                if (event.window, event.atom) in properties:
+                    continue
+                properties.add((event.window, event.atom))
+            elif isinstance(event, output_events):
+                if output:
+                    continue
+                output = True
+
+            if isinstance(event, window_events) \
+                    and destroyed.get(event.window, -1) > i:
+                continue
+            kept.append(event)
+
+        kept.reverse()
+        self.events_coalesced += len(events) - len(kept)
+        return kept
+
+    def handle_event(self, event):
+        if isinstance(event, MapRequestEvent):
+            self.spawn(self.wm.map_request(event.window))
+        elif isinstance(event, DestroyNotifyEvent):
+            self.wm.close_tab(event.window)
+            self.wm.lm.forget_window(event.window)
+            self.conn.forget_window(event.window)
+        elif isinstance(event, ConfigureNotifyEvent):
+            self.conn.update_geometry(
+                event.window, x=event.x, y=event.y,
+                width=event.width, height=event.height
+            )
+            if event.window == self.conn.root:
+                self.wm.update_outputs()
+        elif isinstance(event, ConfigureRequestEvent):
+            self.wm.configure(event)
+        elif isinstance(event, KeyPressEvent):
+            if event.time - self.prev_time > self.sleep_time * 1000:
+                code = event.detail
+                mods = event.state
+                if self.kb and code in self.kb and mods in self.kb[code]:
+                    if self.recorder:
+                        self.recorder.keybind(code, mods)
+                    self.spawn(
+                        self.kb[code][mods][0](*self.kb[code][mods][1:]))
+                self.prev_time = event.time
+        elif isinstance(event, ButtonPressEvent):
+            self.wm.focus_frame(event.child)
+            self.wm.button_press(event)
+            self.conn.replay_pointer(event.time)
+        elif isinstance(event, MotionNotifyEvent):
+            self.wm.button_motion(event, self.motions.get(id(event), 1))
+        elif isinstance(event, ButtonReleaseEvent):
+            self.wm.button_release(event)
+        elif isinstance(event, PropertyNotifyEvent):
+            self.conn.invalidate_property(event.window, event.atom)
+            if event.atom == self.conn.atoms["_NET_WM_USER_TIME"]:
+                self.spawn(self.wm.update_tab_order(event.window))
+            else:
+                for n in self.names:
+                    if event.atom == self.conn.atoms[n.format("")]:
+                        self.wm.set_name(event.window)
+                        break
+                    elif event.atom == self.conn.atoms[n.format("ICON_")]:
+                        self.wm.set_icon_name(event.window)
+                        break
+        elif isinstance(event, EnterNotifyEvent):
+            self.wm.enter_window(event)
+        elif isinstance(event, output_events):
+            self.wm.update_outputs()
+        elif isinstance(event, MapNotifyEvent):
+            pass
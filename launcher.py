@@ -0,0 +1,79 @@
+import asyncio
+import os
+import signal
+import time
+
+
+shell_chars = set("|&;<>()$`\\\"'*?[]#~=%{}\n")
+
+# Python ignores these, and ignored signals survive exec.
+default_signals = (signal.SIGPIPE, signal.SIGXFSZ)
+
+
+class Launcher:
+
+    def __init__(self):
+        self.children = {}
+        self.adopted = []
+        self.spawn_times = []
+        self.max_spawn_times = 100
+        self.sigchld = False
+
+    def spawn(self, command):
+        if shell_chars.intersection(command):
+            argv = ["/bin/sh", "-c", command]
+        else:
+            argv = command.split()
+            if not argv:
+                return 0
+
+        start = time.perf_counter()
+        try:
+            pid = os.posix_spawnp(argv[0], argv, os.environ,
+                                  setsigdef=default_signals)
+        except OSError as e:
+            print(e)
+            return 0
+        self.spawn_times.append(time.perf_counter() - start)
+        del self.spawn_times[:-self.max_spawn_times]
+
+        self.watch(pid)
+        return pid
+
+    def adopt(self, pids):
+        self.adopted.extend(pids)
+
+    def start(self):
+        for pid in self.adopted:
+            self.watch(pid)
+        self.adopted = []
+
+    def watch(self, pid):
+        loop = asyncio.get_running_loop()
+        try:
+            pidfd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            pidfd = None
+
+        self.children[pid] = pidfd
+        if pidfd is not None:
+            loop.add_reader(pidfd, self.reap, pid)
+        elif not self.sigchld:
+            loop.add_signal_handler(signal.SIGCHLD, self.reap_all)
+            self.sigchld = True
+
+    def reap(self, pid):
+        try:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            done = pid
+        if done:
+            pidfd = self.children.pop(pid)
+            if pidfd is not None:
+                asyncio.get_running_loop().remove_reader(pidfd)
+                os.close(pidfd)
+
+    def reap_all(self):
+        for pid in list(self.children):
+            if self.children[pid] is None:
+                self.reap(pid)
@@ -2,49 +2,214 @@
 from xcffib.xproto import ConfigWindow
 
 
+class History:
+
+    def __init__(self):
+        self.items = {}
+
+    def append(self, item):
+        self.items.pop(item, None)
+        self.items[item] = None
+
+    def remove(self, item):
+        del self.items[item]
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if index == -1:
+            return next(reversed(self.items))
+        return list(self.items)[index]
+
+
 class Frame:
-    def __init__(self, fid):
+    __slots__ = ("fid", "history", "decorations", "output", "workspace")
+
+    def __init__(self, fid, output, workspace):
         self.fid = fid
         self.history = []
         self.decorations = True
+        self.output = output
+        self.workspace = workspace
 
 
-class LayoutManager:
+class Output:
 
-    def __init__(self, connection, layouts, root_width, root_height):
-        self.conn = connection
+    def __init__(self, x, y, width, height, layouts):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
 
-        self.frames_fid = {}
-        self.frames_wid = {}
-
-        self.history = []
-        self.max_workspaces = 3
+        self.history = History()
         self.workspace = 0
         self.frame = 0
-        self.workspaces = [[] for _ in range(self.max_workspaces)]
+        self.workspaces = {self.workspace: self.history}
 
         self.layouts = []
         for layout in layouts:
-            self.layouts.append(layout.Layout(self.max_workspaces, root_width,
-                                              root_height))
-        self.layout = [0] * len(self.layouts)
+            self.layouts.append(layout.Layout(width, height))
+        self.layout = {}
+
+    def get_rect(self):
+        return self.x, self.y, self.width, self.height
+
+    def set_rect(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        if (width, height) != (self.width, self.height):
+            self.width = width
+            self.height = height
+            for layout in self.layouts:
+                layout.set_root_size(width, height)
+
+    def get_layout(self):
+        return self.layouts[self.layout.get(self.workspace, 0)]
+
+    def get_history(self, workspace):
+        if workspace not in self.workspaces:
+            self.workspaces[workspace] = History()
+        return self.workspaces[workspace]
+
+    def get_state(self):
+        workspaces = {}
+        for workspace, history in self.workspaces.items():
+            workspaces[workspace] = list(history)
+        return {
+            "rect": self.get_rect(),
+            "workspace": self.workspace,
+            "frame": self.frame,
+            "workspaces": workspaces,
+            "layout": self.layout,
+            "layouts": [layout.get_state() for layout in self.layouts]
+        }
+
+    def set_state(self, state):
+        self.workspace = state["workspace"]
+        self.frame = state["frame"]
+        self.workspaces = {}
+        for workspace, fids in state["workspaces"].items():
+            self.workspaces[workspace] = History()
+            for fid in fids:
+                self.workspaces[workspace].append(fid)
+        self.history = self.get_history(self.workspace)
+        self.layout = state["layout"]
+        for layout, layout_state in zip(self.layouts, state["layouts"]):
+            layout.set_state(layout_state)
+
+    def free_workspace(self, workspace):
+        if workspace != self.workspace and not len(self.workspaces[workspace]):
+            del self.workspaces[workspace]
+            self.layout.pop(workspace, None)
+
+
+class SpatialIndex:
+
+    def __init__(self, cell=256):
+        self.cell = cell
+        self.rects = {}
+        self.cells = {}
+        self.stack = {}
+        self.top = 0
+
+    def keys(self, rect):
+        x, y, width, height = rect
+        for cx in range(x // self.cell, (x + width) // self.cell + 1):
+            for cy in range(y // self.cell, (y + height) // self.cell + 1):
+                yield cx, cy
+
+    def update(self, fid, x, y, width, height):
+        rect = (int(x), int(y), int(width), int(height))
+        if self.rects.get(fid) != rect:
+            self.remove(fid)
+            self.rects[fid] = rect
+            for key in self.keys(rect):
+                if key not in self.cells:
+                    self.cells[key] = set()
+                self.cells[key].add(fid)
+
+    def remove(self, fid):
+        if fid in self.rects:
+            for key in self.keys(self.rects.pop(fid)):
+                self.cells[key].discard(fid)
+                if not self.cells[key]:
+                    del self.cells[key]
+
+    def clear(self):
+        self.rects = {}
+        self.cells = {}
+
+    def raise_frame(self, fid):
+        self.top += 1
+        self.stack[fid] = self.top
+
+    def forget(self, fid):
+        self.remove(fid)
+        if fid in self.stack:
+            del self.stack[fid]
+
+    def contains(self, fid, x, y):
+        if fid not in self.rects:
+            return False
+        fx, fy, width, height = self.rects[fid]
+        return fx <= x <= fx + width and fy <= y <= fy + height
+
+    def frame_at(self, x, y):
+        top = 0
+        key = (int(x) // self.cell, int(y) // self.cell)
+        for fid in self.cells.get(key, ()):
+            if self.contains(fid, x, y) \
+                    and self.stack.get(fid, 0) >= self.stack.get(top, 0):
+                top = fid
+        return top
+
+    def get_corner(self, fid, x, y):
+        fx, fy, width, height = self.rects[fid]
+        corner = "N" if y < fy + height / 2 else "S"
+        corner += "W" if x < fx + width / 2 else "E"
+        return corner
+
 
-        self.root_width = root_width
-        self.root_height = root_height
+class LayoutManager:
+
+    def __init__(self, connection, layouts, outputs):
+        self.conn = connection
+
+        self.frames_fid = {}
+        self.frames_wid = {}
+        self.applied = {}
+
+        self.layout_types = layouts
+        self.outputs = []
+        for x, y, width, height in outputs:
+            self.outputs.append(Output(x, y, width, height, layouts))
+        self.output = self.outputs[0]
+
+        self.index = SpatialIndex()
 
     def append_client(self, fid, wid):
         frame = self.frames_fid[fid]
         frame.history.append(wid)
         self.frames_wid[wid] = frame
-        self.update_layout()
+        self.update_layout(frame.output)
 
     def remove_client(self, fid, wid):
         self.frames_fid[fid].history.remove(wid)
         del self.frames_wid[wid]
+        self.applied.pop(wid, None)
+
+    def is_visible(self, frame):
+        return frame.fid in frame.output.history
 
     def client_exists(self, wid):
-        if wid in self.frames_wid \
-                and self.frames_wid[wid].fid in self.history:
+        if wid in self.frames_wid and self.is_visible(self.frames_wid[wid]):
             return True
         return False
 
@@ -61,159 +226,313 @@ class LayoutManager:
             return 0
 
     def append_frame(self, fid, wid):
-        self.frames_fid[fid] = Frame(fid)
-        self.history.append(fid)
+        output = self.output
+        self.frames_fid[fid] = Frame(fid, output, output.workspace)
+        output.history.append(fid)
+        self.index.raise_frame(fid)
 
         w, h = self.conn.get_size(wid)
-        for layout in self.layouts:
-            layout.append_frame(self.workspace, fid, (w, h))
+        for layout in output.layouts:
+            layout.append_frame(output.workspace, fid, (w, h))
 
     def remove_frame(self, fid):
         if fid in self.frames_fid:
-            del self.frames_fid[fid]
-            self.history.remove(fid)
-            for layout in self.layouts:
-                layout.remove_frame(self.workspace, fid)
-            self.update_layout()
+            frame = self.frames_fid.pop(fid)
+            self.applied.pop(fid, None)
+            for wid in frame.history:
+                self.applied.pop(wid, None)
+            self.index.forget(fid)
+            self.detach_frame(frame)
+
+    def detach_frame(self, frame):
+        output = frame.output
+        output.workspaces[frame.workspace].remove(frame.fid)
+        for layout in output.layouts:
+            layout.remove_frame(frame.workspace, frame.fid)
+        if frame.workspace == output.workspace:
+            self.update_layout(output)
+        else:
+            output.free_workspace(frame.workspace)
 
     def get_frame(self, id):
-        if id in self.frames_fid and id in self.history:
-            return self.frames_fid[id]
+        if id in self.frames_fid:
+            frame = self.frames_fid[id]
         elif id in self.frames_wid:
             frame = self.frames_wid[id]
-            if frame.fid in self.history:
-                return frame
+        else:
+            return None
+        if self.is_visible(frame):
+            return frame
         return None
 
     def get_n_frames(self):
-        return len(self.history)
+        return len(self.output.history)
 
     def frame_exists(self, fid):
-        return fid in self.history
+        return fid in self.frames_fid and self.is_visible(self.frames_fid[fid])
 
     def get_next_frame(self):
-        if self.frame + 1 >= self.get_n_frames():
-            self.frame = 0
+        output = self.output
+        if output.frame + 1 >= self.get_n_frames():
+            output.frame = 0
         else:
-            self.frame += 1
-        fid = self.layouts[self.layout[self.workspace]].get_nth_fid(
-                self.workspace, self.frame)
+            output.frame += 1
+        fid = output.get_layout().get_nth_fid(output.workspace, output.frame)
         if fid != 0:
             return self.frames_fid[fid]
         else:
             return None
 
     def get_prev_frame(self):
-        if self.frame - 1 < 0:
-            self.frame = self.get_n_frames() - 1
+        output = self.output
+        if output.frame - 1 < 0:
+            output.frame = self.get_n_frames() - 1
         else:
-            self.frame -= 1
-        fid = self.layouts[self.layout[self.workspace]].get_nth_fid(
-                self.workspace, self.frame)
+            output.frame -= 1
+        fid = output.get_layout().get_nth_fid(output.workspace, output.frame)
         if fid != 0:
             return self.frames_fid[fid]
         else:
             return None
 
     def get_position(self, fid):
-        return self.layouts[self.layout[self.workspace]].get_position(
-                self.workspace, fid)
+        return self.output.get_layout().get_position(self.output.workspace,
+                                                     fid)
 
     def set_position(self, fid, position):
-        self.layouts[self.layout[self.workspace]].set_position(
-                self.workspace, fid, position)
+        self.output.get_layout().set_position(self.output.workspace, fid,
+                                              position)
         self.update_layout()
 
     def set_size(self, fid, width, height):
-        self.layouts[self.layout[self.workspace]].set_size(
-                self.workspace, fid, width, height)
+        self.output.get_layout().set_size(self.output.workspace, fid, width,
+                                          height)
         self.update_layout()
 
     def resize_frame(self, fid, x, y):
-        self.layouts[self.layout[self.workspace]].resize_frame(
-                self.workspace, fid, x, y)
+        self.output.get_layout().resize_frame(self.output.workspace, fid, x,
+                                              y)
         self.update_layout()
 
     def set_focused_frame(self, fid):
-        self.history.append(self.history.pop(self.history.index(fid)))
-        self.frame = self.layouts[self.layout[self.workspace]] \
-            .get_position(self.workspace, fid)
+        output = self.frames_fid[fid].output
+        self.output = output
+        output.history.append(fid)
+        self.index.raise_frame(fid)
+        output.frame = output.get_layout().get_position(output.workspace, fid)
 
     def get_dimensions(self, wid):
-        x, y, width, height = self.layouts[self.layout[self.workspace]] \
-                .get_dimensions(self.workspace)
-        fid = self.frames_wid[wid].fid
-        if self.frames_fid[fid].decorations:
-            height[fid] -= 34
-            y[fid] += 34
-        return x[fid], y[fid], width[fid], height[fid]
+        frame = self.frames_wid[wid]
+        output = frame.output
+        x, y, width, height = output.get_layout().get_frame_dimensions(
+                output.workspace, frame.fid)
+        if frame.decorations:
+            height -= 34
+            y += 34
+        return x, y, width, height
 
     def set_layout(self, id):
-        if id >= 0 and id < len(self.layouts):
-            self.layout[self.workspace] = id
+        if id >= 0 and id < len(self.output.layouts):
+            self.output.layout[self.output.workspace] = id
             self.update_layout()
 
-    def update_layout(self):
-        x, y, width, height = self.layouts[self.layout[self.workspace]] \
-                .get_dimensions(self.workspace)
-        for fid in self.history:
-            self.conn.configure_window(
-                fid, x=x[fid], y=y[fid], width=width[fid], height=height[fid]
-            )
+    def update_layout(self, output=None):
+        if output is None:
+            output = self.output
+        x, y, width, height = output.get_layout().get_dimensions(
+                output.workspace)
+        for fid in output.history:
+            fx = x[fid] + output.x
+            fy = y[fid] + output.y
+            self.configure(fid, fx, fy, width[fid], height[fid])
+            self.index.update(fid, fx, fy, width[fid], height[fid])
 
             cy = 0
+            cheight = height[fid]
             if self.frames_fid[fid].decorations:
-                height[fid] -= 34
+                cheight -= 34
                 cy = 34
 
             for wid in self.frames_fid[fid].history:
-                self.conn.configure_window(
-                    wid, x=0, y=cy, width=width[fid], height=height[fid]
-                )
-                if self.get_frame(fid).decorations:
-                    self.conn.update_corners(wid, 0, 10)
-                else:
-                    self.conn.update_corners(wid, 10, 10)
+                if self.configure(wid, 0, cy, width[fid], cheight):
+                    if self.frames_fid[fid].decorations:
+                        self.conn.update_corners(wid, 0, 10)
+                    else:
+                        self.conn.update_corners(wid, 10, 10)
+
+    def configure(self, wid, x, y, width, height):
+        geometry = (x, y, width, height)
+        if self.applied.get(wid) == geometry:
+            return False
+        self.applied[wid] = geometry
+        self.conn.configure_window(wid, x=x, y=y, width=width, height=height)
+        return True
+
+    def forget_window(self, wid):
+        self.applied.pop(wid, None)
+
+    def frame_at(self, x, y):
+        return self.index.frame_at(x, y)
+
+    def is_inside(self, fid, x, y):
+        return self.index.contains(fid, x, y)
+
+    def get_corner(self, fid, x, y):
+        return self.index.get_corner(fid, x, y)
 
     def set_workspace(self, id):
-        if id < self.max_workspaces and id != self.workspace:
-            for fid in self.history:
+        output = self.output
+        if id >= 0 and id != output.workspace:
+            for fid in output.history:
                 self.conn.unmap_window(fid)
+                self.index.remove(fid)
 
-            self.workspaces[self.workspace] = self.history
-            self.workspace = id
-            self.history = self.workspaces[id]
+            workspace = output.workspace
+            output.workspace = id
+            output.history = output.get_history(id)
+            output.free_workspace(workspace)
 
-            for fid in self.history:
+            for fid in output.history:
                 self.conn.map_window(fid)
 
-            if len(self.history):
-                frame = self.get_frame(self.history[-1])
+            if len(output.history):
+                frame = self.get_frame(output.history[-1])
                 if len(frame.history):
                     self.conn.set_input_focus(frame.history[-1])
 
             self.update_layout()
 
+    def get_last_workspace(self):
+        return max(self.output.workspaces)
+
     def move_to_workspace(self, fid, id):
-        if id < self.max_workspaces and id != self.workspace:
-            self.workspaces[id].append(fid)
-            self.history.remove(fid)
+        output = self.output
+        if id >= 0 and id != output.workspace:
+            output.get_history(id).append(fid)
+            output.history.remove(fid)
+            self.frames_fid[fid].workspace = id
+            self.index.remove(fid)
             self.conn.unmap_window(fid)
-            for layout in self.layouts:
-                layout.change_workspace(self.workspace, id, fid)
+            for layout in output.layouts:
+                layout.change_workspace(output.workspace, id, fid)
             self.update_layout()
 
+    def get_state(self):
+        frames = {}
+        for fid, frame in self.frames_fid.items():
+            frames[fid] = (frame.history, frame.decorations,
+                           self.outputs.index(frame.output), frame.workspace)
+        return {
+            "outputs": [output.get_state() for output in self.outputs],
+            "output": self.outputs.index(self.output),
+            "frames": frames
+        }
+
+    def set_state(self, state):
+        self.outputs = []
+        for output_state in state["outputs"]:
+            output = Output(*output_state["rect"], self.layout_types)
+            output.set_state(output_state)
+            self.outputs.append(output)
+        self.output = self.outputs[state["output"]]
+
+        self.frames_fid = {}
+        self.frames_wid = {}
+        self.applied = {}
+        self.index = SpatialIndex()
+        for fid, (wids, decorations, output, workspace) \
+                in state["frames"].items():
+            frame = Frame(fid, self.outputs[output], workspace)
+            frame.decorations = decorations
+            self.frames_fid[fid] = frame
+            for wid in wids:
+                frame.history.append(wid)
+                self.frames_wid[wid] = frame
+        for output in self.outputs:
+            for fid in output.history:
+                self.index.raise_frame(fid)
+
+    def set_output(self, output):
+        self.output = output
+        if len(output.history):
+            return self.frames_fid[output.history[-1]]
+        return None
+
+    def get_next_output(self):
+        i = self.outputs.index(self.output)
+        return self.outputs[(i + 1) % len(self.outputs)]
+
+    def move_to_output(self, fid, output):
+        frame = self.frames_fid[fid]
+        if frame.output is not output:
+            self.index.remove(fid)
+            self.detach_frame(frame)
+            self.attach_frame(frame, output, output.workspace)
+            self.update_layout(output)
+
+    def attach_frame(self, frame, output, workspace):
+        frame.output = output
+        frame.workspace = workspace
+        output.get_history(workspace).append(frame.fid)
+        # Layouts take the size of the client below the header, as in
+        # append_frame, so a floating frame keeps its size.
+        width, height = self.conn.get_size(frame.fid)
+        for layout in output.layouts:
+            layout.append_frame(workspace, frame.fid, (width, height - 34))
+        if workspace == output.workspace:
+            self.conn.map_window(frame.fid)
+        else:
+            self.conn.unmap_window(frame.fid)
+
+    def set_outputs(self, rects):
+        unused = {}
+        for output in self.outputs:
+            unused[output.get_rect()] = output
+        outputs = []
+        for rect in rects:
+            outputs.append(unused.pop(rect, None))
+
+        # Outputs that kept their rectangle are left alone; moved or
+        # resized ones are reused in order and only they are laid out.
+        vanished = list(unused.values())
+        changed = []
+        for i, rect in enumerate(rects):
+            if outputs[i] is None:
+                if vanished:
+                    outputs[i] = vanished.pop(0)
+                    outputs[i].set_rect(*rect)
+                else:
+                    outputs[i] = Output(*rect, self.layout_types)
+                changed.append(outputs[i])
+        self.outputs = outputs
+
+        target = outputs[0]
+        for output in vanished:
+            for workspace, history in output.workspaces.items():
+                for fid in history:
+                    if output.workspace == workspace:
+                        self.index.remove(fid)
+                    self.attach_frame(self.frames_fid[fid], target,
+                                      workspace)
+            if target not in changed:
+                changed.append(target)
+        if self.output not in outputs:
+            self.output = target
+
+        for output in changed:
+            self.update_layout(output)
+
     def move(self, fid, x, y):
-        self.layouts[self.layout[self.workspace]].move_frame(
-                self.workspace, fid, x, y)
+        self.output.get_layout().move_frame(self.output.workspace, fid, x, y)
         self.update_layout()
 
     def resize(self, fid, x, y, corner):
-        self.layouts[self.layout[self.workspace]].resize_frame(
-                self.workspace, fid, x, y, corner)
+        self.output.get_layout().resize_frame(self.output.workspace, fid, x,
+                                              y, corner)
         self.update_layout()
 
     def switch(self, fid1, fid2):
-        self.layouts[self.layout[self.workspace]].switch_frame(
-                self.workspace, fid1, fid2)
-        self.update_layout()
+        if self.frames_fid[fid2].output is self.output:
+            self.output.get_layout().switch_frame(self.output.workspace,
+                                                  fid1, fid2)
+            self.update_layout()
@@ -0,0 +1,293 @@
+class Node:
+    __slots__ = ("fid", "parent", "first", "second", "vertical", "ratio",
+                 "x", "y", "width", "height")
+
+    def __init__(self, fid=0, parent=None):
+        self.fid = fid
+        self.parent = parent
+        self.first = None
+        self.second = None
+        self.vertical = False
+        self.ratio = 0.5
+        self.x = 0
+        self.y = 0
+        self.width = 0
+        self.height = 0
+
+
+class Layout:
+
+    def __init__(self, root_width, root_height):
+        self.gap = 25
+        self.min_width = 100
+        self.min_height = 100
+        self.root_width = root_width
+        self.root_height = root_height
+        self.roots = {}
+        self.leaves = {}
+        self.order = {}
+        self.dimensions = {}
+        self.positions = {}
+
+    def append_frame(self, workspace, fid, geometry):
+        leaf = Node(fid)
+        if workspace not in self.roots:
+            self.roots[workspace] = leaf
+            self.leaves[workspace] = {fid: leaf}
+            self.order[workspace] = []
+            self.dimensions[workspace] = ({}, {}, {}, {})
+            self.place(workspace, leaf, self.gap, self.gap,
+                       self.root_width - 2 * self.gap,
+                       self.root_height - 2 * self.gap)
+        else:
+            node = self.get_largest_leaf(workspace)
+            self.leaves[workspace][fid] = leaf
+            self.split(workspace, node, leaf)
+        self.order[workspace].append(fid)
+        if workspace in self.positions:
+            self.positions[workspace][fid] = len(self.order[workspace]) - 1
+
+    def get_largest_leaf(self, workspace):
+        largest = None
+        for fid in reversed(self.order[workspace]):
+            leaf = self.leaves[workspace][fid]
+            if largest is None or leaf.width * leaf.height \
+                    > largest.width * largest.height:
+                largest = leaf
+        return largest
+
+    def split(self, workspace, node, leaf):
+        old = Node(node.fid, node)
+        self.leaves[workspace][node.fid] = old
+        leaf.parent = node
+        node.fid = 0
+        node.first = old
+        node.second = leaf
+        wide = node.width - self.gap >= 2 * self.min_width
+        tall = node.height - self.gap >= 2 * self.min_height
+        if wide and (node.width >= node.height or not tall):
+            node.vertical = True
+        elif tall:
+            node.vertical = False
+        else:
+            # Too small to split either way, so the new frame is stacked
+            # on top of the old one.
+            node.vertical = None
+            print("Max windows reached")
+        node.ratio = 0.5
+        self.place(workspace, node, node.x, node.y, node.width, node.height)
+
+    def set_root_size(self, root_width, root_height):
+        self.root_width = root_width
+        self.root_height = root_height
+        for workspace, root in self.roots.items():
+            self.place(workspace, root, self.gap, self.gap,
+                       root_width - 2 * self.gap, root_height - 2 * self.gap)
+
+    def get_state(self):
+        state = {}
+        for workspace, root in self.roots.items():
+            state[workspace] = (self.dump(root), self.order[workspace])
+        return state
+
+    def dump(self, node):
+        if node.fid:
+            return node.fid
+        return (node.vertical, node.ratio, self.dump(node.first),
+                self.dump(node.second))
+
+    def set_state(self, state):
+        self.roots = {}
+        self.leaves = {}
+        self.order = {}
+        self.dimensions = {}
+        self.positions = {}
+        for workspace, (tree, order) in state.items():
+            self.leaves[workspace] = {}
+            self.order[workspace] = order
+            self.dimensions[workspace] = ({}, {}, {}, {})
+            self.roots[workspace] = self.load(workspace, tree, None)
+            self.place(workspace, self.roots[workspace], self.gap, self.gap,
+                       self.root_width - 2 * self.gap,
+                       self.root_height - 2 * self.gap)
+
+    def load(self, workspace, tree, parent):
+        if isinstance(tree, int):
+            node = Node(tree, parent)
+            self.leaves[workspace][tree] = node
+        else:
+            node = Node(0, parent)
+            node.vertical, node.ratio, first, second = tree
+            node.first = self.load(workspace, first, node)
+            node.second = self.load(workspace, second, node)
+        return node
+
+    def change_workspace(self, ws1, ws2, fid):
+        self.remove_frame(ws1, fid)
+        self.append_frame(ws2, fid, None)
+
+    def remove_frame(self, workspace, fid):
+        self.positions.pop(workspace, None)
+        self.order[workspace].remove(fid)
+        leaf = self.leaves[workspace].pop(fid)
+        for dimension in self.dimensions[workspace]:
+            del dimension[fid]
+
+        parent = leaf.parent
+        if parent is None:
+            del self.roots[workspace]
+            del self.leaves[workspace]
+            del self.order[workspace]
+            del self.dimensions[workspace]
+            return
+
+        if parent.first is leaf:
+            sibling = parent.second
+        else:
+            sibling = parent.first
+        sibling.parent = parent.parent
+        if parent.parent is None:
+            self.roots[workspace] = sibling
+        elif parent.parent.first is parent:
+            parent.parent.first = sibling
+        else:
+            parent.parent.second = sibling
+        self.place(workspace, sibling, parent.x, parent.y, parent.width,
+                   parent.height)
+
+    def get_position(self, workspace, fid):
+        position = self.get_index(workspace, fid)
+        if position is not None:
+            return position
+        else:
+            return 0
+
+    def get_index(self, workspace, fid):
+        if workspace not in self.order:
+            return None
+        if workspace not in self.positions:
+            self.positions[workspace] = {
+                f: i for i, f in enumerate(self.order[workspace])
+            }
+        return self.positions[workspace].get(fid)
+
+    def set_position(self, workspace, fid, position):
+        if position < len(self.order[workspace]):
+            fid2 = self.order[workspace][position]
+            if fid2 != fid:
+                self.switch_frame(workspace, fid, fid2)
+
+    def get_nth_fid(self, workspace, n):
+        if n < len(self.order.get(workspace, ())):
+            return self.order[workspace][n]
+        else:
+            return 0
+
+    def move_frame(self, workspace, fid, x, y):
+        pass
+
+    def set_size(self, workspace, fid, width, height):
+        pass
+
+    def resize_frame(self, workspace, fid, x, y, corner):
+        leaf = self.leaves.get(workspace, {}).get(fid)
+        if leaf is None:
+            return
+        if x:
+            self.move_edge(workspace, leaf, x, True, corner[1] == "E")
+        if y:
+            self.move_edge(workspace, leaf, y, False, corner[0] == "S")
+
+    def move_edge(self, workspace, node, delta, vertical, after):
+        # The edge being dragged is the divider of the closest ancestor
+        # split in that direction with the frame on the matching side.
+        while node.parent is not None:
+            parent = node.parent
+            if parent.vertical == vertical and (parent.first is node) == after:
+                break
+            node = parent
+        else:
+            return
+
+        if vertical:
+            size = parent.width - self.gap
+            minimum = self.min_width
+        else:
+            size = parent.height - self.gap
+            minimum = self.min_height
+        if size < 2 * minimum:
+            return
+
+        first = size * parent.ratio + delta
+        first = min(max(first, minimum), size - minimum)
+        parent.ratio = first / size
+        self.place(workspace, parent, parent.x, parent.y, parent.width,
+                   parent.height)
+
+    def switch_frame(self, workspace, fid1, fid2):
+        leaves = self.leaves[workspace]
+        leaf1 = leaves[fid1]
+        leaf2 = leaves[fid2]
+        leaf1.fid = fid2
+        leaf2.fid = fid1
+        leaves[fid1] = leaf2
+        leaves[fid2] = leaf1
+        for dimension in self.dimensions[workspace]:
+            dimension[fid1], dimension[fid2] = dimension[fid2], dimension[fid1]
+
+        i = self.get_index(workspace, fid1)
+        j = self.get_index(workspace, fid2)
+        self.order[workspace][j] = fid1
+        self.order[workspace][i] = fid2
+        self.positions[workspace][fid1] = j
+        self.positions[workspace][fid2] = i
+
+    def place(self, workspace, node, x, y, width, height):
+        xs, ys, widths, heights = self.dimensions[workspace]
+        stack = [(node, x, y, width, height)]
+        while stack:
+            node, x, y, width, height = stack.pop()
+            node.x = x
+            node.y = y
+            node.width = width
+            node.height = height
+            if node.fid:
+                xs[node.fid] = x
+                ys[node.fid] = y
+                widths[node.fid] = width
+                heights[node.fid] = height
+                continue
+
+            # A split that no longer leaves both sides their minimum, for
+            # example after the output shrank, stacks them instead.
+            if node.vertical:
+                first = self.divide(width, node.ratio, self.min_width)
+            elif node.vertical is not None:
+                first = self.divide(height, node.ratio, self.min_height)
+            else:
+                first = None
+
+            if first is None:
+                stack.append((node.first, x, y, width, height))
+                stack.append((node.second, x, y, width, height))
+            elif node.vertical:
+                stack.append((node.first, x, y, first, height))
+                stack.append((node.second, x + first + self.gap, y,
+                              width - first - self.gap, height))
+            else:
+                stack.append((node.first, x, y, width, first))
+                stack.append((node.second, x, y + first + self.gap, width,
+                              height - first - self.gap))
+
+    def divide(self, size, ratio, minimum):
+        size -= self.gap
+        if size < 2 * minimum:
+            return None
+        return min(max(int(size * ratio), minimum), size - minimum)
+
+    def get_dimensions(self, workspace):
+        return self.dimensions.get(workspace, ({}, {}, {}, {}))
+
+    def get_frame_dimensions(self, workspace, fid):
+        x, y, width, height = self.dimensions[workspace]
+        return x[fid], y[fid], width[fid], height[fid]
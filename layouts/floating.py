@@ -1,19 +1,25 @@
 
 class Layout:
 
-    def __init__(self, max_workspaces, root_width, root_height):
+    def __init__(self, root_width, root_height):
         self.root_width = root_width
         self.root_height = root_height
 
-        self.x = [{} for _ in range(max_workspaces)]
-        self.y = [{} for _ in range(max_workspaces)]
-        self.width = [{} for _ in range(max_workspaces)]
-        self.height = [{} for _ in range(max_workspaces)]
+        self.x = {}
+        self.y = {}
+        self.width = {}
+        self.height = {}
 
         self.min_width = 100
         self.min_height = 60
 
+        self.cache = {}
+
     def append_frame(self, workspace, fid, geometry):
+        self.cache.pop(workspace, None)
+        if workspace not in self.x:
+            for i in [self.x, self.y, self.width, self.height]:
+                i[workspace] = {}
         if geometry[0]:
             width = geometry[0]
         else:
@@ -31,16 +37,35 @@ class Layout:
         self.y[workspace][fid] = (self.root_height - height) // 2 + 25 \
             * len(self.y[workspace])
 
+    def set_root_size(self, root_width, root_height):
+        self.root_width = root_width
+        self.root_height = root_height
+        self.cache = {}
+
+    def get_state(self):
+        return self.x, self.y, self.width, self.height
+
+    def set_state(self, state):
+        self.x, self.y, self.width, self.height = state
+        self.cache = {}
+
     def change_workspace(self, ws1, ws2, fid):
+        self.cache.pop(ws2, None)
         for i in [self.x, self.y, self.width, self.height]:
+            if ws2 not in i:
+                i[ws2] = {}
             i[ws2][fid] = i[ws1][fid]
-            del i[ws1][fid]
+        self.remove_frame(ws1, fid)
 
     def remove_frame(self, workspace, fid):
+        self.cache.pop(workspace, None)
         del self.x[workspace][fid]
         del self.y[workspace][fid]
         del self.width[workspace][fid]
         del self.height[workspace][fid]
+        if not self.x[workspace]:
+            for i in [self.x, self.y, self.width, self.height]:
+                del i[workspace]
 
     def get_position(self, workspace, fid):
         return 0
@@ -52,16 +77,19 @@ class Layout:
         return 0
 
     def move_frame(self, workspace, fid, x, y):
+        self.cache.pop(workspace, None)
         self.x[workspace][fid] += x
         self.y[workspace][fid] += y
 
     def set_size(self, workspace, fid, width, height):
+        self.cache.pop(workspace, None)
         if width >= self.min_width:
             self.width[workspace][fid] = width
         if height >= self.min_height:
             self.height[workspace][fid] = height
 
     def resize_frame(self, workspace, fid, x, y, corner):
+        self.cache.pop(workspace, None)
         if corner[0] == "N":
             if self.height[workspace][fid] - y >= self.min_height:
                 self.y[workspace][fid] += y
@@ -83,12 +111,23 @@ class Layout:
         pass
 
     def get_dimensions(self, workspace):
+        if workspace not in self.x:
+            return {}, {}, {}, {}
+        if workspace not in self.cache:
+            self.cache[workspace] = self.compute_dimensions(workspace)
+        return self.cache[workspace]
+
+    def get_frame_dimensions(self, workspace, fid):
+        x, y, width, height = self.get_dimensions(workspace)
+        return x[fid], y[fid], width[fid], height[fid]
+
+    def compute_dimensions(self, workspace):
         x = {}
         y = {}
         width = {}
         height = {}
 
-        for fid in self.x[workspace]:
+        for fid in self.x.get(workspace, ()):
             x[fid] = self.x[workspace][fid]
             y[fid] = self.y[workspace][fid]
             width[fid] = self.width[workspace][fid]
@@ -1,32 +1,66 @@
 
 class Layout:
 
-    def __init__(self, max_workspaces, root_width, root_height):
+    def __init__(self, root_width, root_height):
         self.root_width = root_width
         self.root_height = root_height
-        self.order = {i: [] for i in range(max_workspaces)}
+        self.order = {}
+        self.cache = {}
+        self.positions = {}
 
     def append_frame(self, workspace, fid, geometry):
+        self.cache.pop(workspace, None)
+        if workspace not in self.order:
+            self.order[workspace] = []
         self.order[workspace].append(fid)
+        if workspace in self.positions:
+            self.positions[workspace][fid] = len(self.order[workspace]) - 1
+
+    def set_root_size(self, root_width, root_height):
+        self.root_width = root_width
+        self.root_height = root_height
+        self.cache = {}
+
+    def get_state(self):
+        return self.order
+
+    def set_state(self, state):
+        self.order = state
+        self.cache = {}
+        self.positions = {}
 
     def change_workspace(self, ws1, ws2, fid):
-        self.order[ws2].append(fid)
-        self.order[ws1].remove(fid)
+        self.remove_frame(ws1, fid)
+        self.append_frame(ws2, fid, None)
 
     def remove_frame(self, workspace, fid):
+        self.cache.pop(workspace, None)
+        self.positions.pop(workspace, None)
         self.order[workspace].remove(fid)
+        if not self.order[workspace]:
+            del self.order[workspace]
 
     def get_position(self, workspace, fid):
-        if fid in self.order[workspace]:
-            return self.order[workspace].index(fid)
+        position = self.get_index(workspace, fid)
+        if position is not None:
+            return position
         else:
             return 0
 
+    def get_index(self, workspace, fid):
+        if workspace not in self.order:
+            return None
+        if workspace not in self.positions:
+            self.positions[workspace] = {
+                f: i for i, f in enumerate(self.order[workspace])
+            }
+        return self.positions[workspace].get(fid)
+
     def set_position(self, workspace, fid, position):
         pass
 
     def get_nth_fid(self, workspace, n):
-        if n < len(self.order[workspace]):
+        if n < len(self.order.get(workspace, ())):
             return self.order[workspace][n]
         else:
             return
@@ -44,12 +78,23 @@ class Layout:
         pass
 
     def get_dimensions(self, workspace):
+        if workspace not in self.order:
+            return {}, {}, {}, {}
+        if workspace not in self.cache:
+            self.cache[workspace] = self.compute_dimensions(workspace)
+        return self.cache[workspace]
+
+    def get_frame_dimensions(self, workspace, fid):
+        x, y, width, height = self.get_dimensions(workspace)
+        return x[fid], y[fid], width[fid], height[fid]
+
+    def compute_dimensions(self, workspace):
         x = {}
         y = {}
         width = {}
         height = {}
 
-        for fid in self.order[workspace]:
+        for fid in self.order.get(workspace, ()):
             x[fid] = 0
             y[fid] = 0
             width[fid] = self.root_width
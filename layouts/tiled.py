@@ -1,16 +1,22 @@
 
 class Layout:
 
-    def __init__(self, max_workspaces, root_width, root_height):
+    def __init__(self, root_width, root_height):
         self.gap = 25
         self.min_width = 100
         self.min_height = 100
         self.root_width = root_width
         self.root_height = root_height
-        self.order = {i: [] for i in range(max_workspaces)}
-        self.sizes = {i: [] for i in range(max_workspaces)}
+        self.order = {}
+        self.sizes = {}
+        self.cache = {}
+        self.positions = {}
 
     def append_frame(self, workspace, fid, geometry):
+        self.cache.pop(workspace, None)
+        if workspace not in self.order:
+            self.order[workspace] = []
+            self.sizes[workspace] = []
         if len(self.sizes[workspace]) == 0:
             size = self.root_height - 2 * self.gap - \
                 (self.root_width - self.gap * 3) / 2
@@ -28,29 +34,44 @@ class Layout:
             self.sizes[workspace].append(h)
             self.fix_min(workspace, 1, len(self.sizes[workspace]))
         self.order[workspace].append(fid)
+        if workspace in self.positions:
+            self.positions[workspace][fid] = len(self.order[workspace]) - 1
 
     def fix_min(self, workspace, f, n):
-        rdy = False
-        too_small = []
-        while not rdy:
-            w = 0
-            for i in range(f, n):
-                if self.sizes[workspace][i] < self.min_height:
-                    w += self.min_height - self.sizes[workspace][i]
-                    self.sizes[workspace][i] = self.min_height
-                    too_small.append(i)
-            if not w:
-                rdy = True
-            else:
-                good = [x for x in range(f, n) if x not in too_small]
-                for i in good:
-                    self.sizes[workspace][i] -= w / len(good)
+        self.sizes[workspace][f:n] = fit_min(self.sizes[workspace][f:n],
+                                             self.min_height)
+
+    def set_root_size(self, root_width, root_height):
+        for workspace in self.sizes:
+            sizes = self.sizes[workspace]
+            if len(sizes) > 1:
+                space = self.root_height - len(sizes) * self.gap
+                if space > 0:
+                    scale = (root_height - len(sizes) * self.gap) / space
+                    for i in range(1, len(sizes)):
+                        sizes[i] *= scale
+                    self.fix_min(workspace, 1, len(sizes))
+                limit = root_width / 2 - self.gap - self.min_width
+                sizes[0] = min(max(sizes[0], -limit), limit)
+        self.root_width = root_width
+        self.root_height = root_height
+        self.cache = {}
+
+    def get_state(self):
+        return self.order, self.sizes
+
+    def set_state(self, state):
+        self.order, self.sizes = state
+        self.cache = {}
+        self.positions = {}
 
     def change_workspace(self, ws1, ws2, fid):
-        self.order[ws2].append(fid)
-        self.order[ws1].remove(fid)
+        self.remove_frame(ws1, fid)
+        self.append_frame(ws2, fid, None)
 
     def remove_frame(self, workspace, fid):
+        self.cache.pop(workspace, None)
+        self.positions.pop(workspace, None)
         self.order[workspace].remove(fid)
         del self.sizes[workspace][-1]
         if len(self.sizes[workspace]) > 1:
@@ -60,19 +81,35 @@ class Layout:
                   * self.gap) / (len(self.sizes[workspace]) - 1)
             for i in range(1, len(self.sizes[workspace])):
                 self.sizes[workspace][i] *= h2 / h
+            self.fix_min(workspace, 1, len(self.sizes[workspace]))
+        elif not self.order[workspace]:
+            del self.order[workspace]
+            del self.sizes[workspace]
 
     def get_position(self, workspace, fid):
-        if fid in self.order[workspace]:
-            return self.order[workspace].index(fid)
+        position = self.get_index(workspace, fid)
+        if position is not None:
+            return position
         else:
             return 0
 
+    def get_index(self, workspace, fid):
+        if workspace not in self.order:
+            return None
+        if workspace not in self.positions:
+            self.positions[workspace] = {
+                f: i for i, f in enumerate(self.order[workspace])
+            }
+        return self.positions[workspace].get(fid)
+
     def set_position(self, workspace, fid, position):
+        self.cache.pop(workspace, None)
+        self.positions.pop(workspace, None)
         self.order[workspace].remove(fid)
         self.order[workspace].insert(position, fid)
 
     def get_nth_fid(self, workspace, n):
-        if n < len(self.order[workspace]):
+        if n < len(self.order.get(workspace, ())):
             return self.order[workspace][n]
         else:
             return 0
@@ -84,8 +121,9 @@ class Layout:
         pass
 
     def resize_frame(self, workspace, fid, x, y, corner):
-        if len(self.order[workspace]) > 1 and fid in self.order[workspace]:
-            i = self.order[workspace].index(fid)
+        self.cache.pop(workspace, None)
+        i = self.get_index(workspace, fid)
+        if i is not None and len(self.order[workspace]) > 1:
             if i:
                 if corner[0] == "N" and i > 1:
                     self.sizes[workspace][i] -= y
@@ -111,16 +149,34 @@ class Layout:
                                              - self.min_width)
 
     def switch_frame(self, workspace, fid1, fid2):
-        i = self.order[workspace].index(fid1)
-        self.order[workspace][self.order[workspace].index(fid2)] = fid1
+        self.cache.pop(workspace, None)
+        i = self.get_index(workspace, fid1)
+        j = self.get_index(workspace, fid2)
+        self.order[workspace][j] = fid1
         self.order[workspace][i] = fid2
+        self.positions[workspace][fid1] = j
+        self.positions[workspace][fid2] = i
 
     def get_dimensions(self, workspace):
+        if workspace not in self.order:
+            return {}, {}, {}, {}
+        if workspace not in self.cache:
+            self.cache[workspace] = self.compute_dimensions(workspace)
+        return self.cache[workspace]
+
+    def get_frame_dimensions(self, workspace, fid):
+        x, y, width, height = self.get_dimensions(workspace)
+        return x[fid], y[fid], width[fid], height[fid]
+
+    def compute_dimensions(self, workspace):
         x = {}
         y = {}
         width = {}
         height = {}
 
+        if workspace not in self.order:
+            return x, y, width, height
+
         if len(self.order[workspace]) == 1:
             o = self.order[workspace][0]
             x[o] = self.gap
@@ -151,3 +207,23 @@ class Layout:
                 height[self.order[workspace][-1]] += err
 
         return x, y, width, height
+
+
+def fit_min(sizes, minimum):
+    # Raise every entry below minimum and take the difference evenly from
+    # the rest, keeping the total: size = max(minimum, size - shift).
+    n = len(sizes)
+    total = sum(sizes)
+    if n == 0 or min(sizes) >= minimum:
+        return sizes
+    if total <= n * minimum:
+        return [total / n] * n
+
+    ordered = sorted(sizes)
+    rest = total
+    for k in range(n):
+        rest -= ordered[k]
+        shift = (rest - (total - (k + 1) * minimum)) / (n - k - 1)
+        if ordered[k + 1] - shift >= minimum:
+            break
+    return [max(minimum, size - shift) for size in sizes]
@@ -1,16 +1,21 @@
 #!/bin/env python3
 
-from layouts import tiled, fullscreen, floating
+import sys
+
+from layouts import tiled, fullscreen, floating, bsp
 from wm import WindowManager
 from events import EventHandler
+import tracing
 
-layouts = [tiled, fullscreen, floating]
+layouts = [tiled, fullscreen, floating, bsp]
 
 keybinds = {
     "Mod1 + Return": [WindowManager.execute, "termite"],
     "Mod1 + e": [WindowManager.execute, "thunar"],
     "Mod1 + d": [WindowManager.execute, "dmenu_run"],
     "Mod1 + w": [WindowManager.destroy],
+    "Shift + Mod1 + r": [WindowManager.restart],
+    "Shift + Mod1 + q": [WindowManager.quit],
     "Shift + Mod1 + w": [WindowManager.destroy_frame],
     "Mod1 + Tab": [WindowManager.next_frame],
     "Shift + Mod1 + Tab": [WindowManager.prev_frame],
@@ -28,20 +33,39 @@ keybinds = {
     "Mod1 + 1": [WindowManager.set_workspace, 0],
     "Mod1 + 2": [WindowManager.set_workspace, 1],
     "Mod1 + 3": [WindowManager.set_workspace, 2],
+    "Mod1 + 4": [WindowManager.set_workspace, 3],
+    "Mod1 + 5": [WindowManager.set_workspace, 4],
+    "Mod1 + 6": [WindowManager.set_workspace, 5],
+    "Mod1 + 7": [WindowManager.set_workspace, 6],
+    "Mod1 + 8": [WindowManager.set_workspace, 7],
     "Mod1 + 9": [WindowManager.prev_workspace],
     "Mod1 + 0": [WindowManager.next_workspace],
     "Shift + Mod1 + 1": [WindowManager.move_frame_workspace, 0],
     "Shift + Mod1 + 2": [WindowManager.move_frame_workspace, 1],
     "Shift + Mod1 + 3": [WindowManager.move_frame_workspace, 2],
+    "Shift + Mod1 + 4": [WindowManager.move_frame_workspace, 3],
+    "Shift + Mod1 + 5": [WindowManager.move_frame_workspace, 4],
+    "Shift + Mod1 + 6": [WindowManager.move_frame_workspace, 5],
+    "Shift + Mod1 + 7": [WindowManager.move_frame_workspace, 6],
+    "Shift + Mod1 + 8": [WindowManager.move_frame_workspace, 7],
     "Shift + Mod1 + 9": [WindowManager.move_frame_prev_workspace],
     "Shift + Mod1 + 0": [WindowManager.move_frame_next_workspace],
+    "Mod1 + period": [WindowManager.next_output],
+    "Shift + Mod1 + period": [WindowManager.move_frame_next_output],
     "Mod1 + i": [WindowManager.set_layout, 0],
     "Mod1 + o": [WindowManager.set_layout, 1],
     "Mod1 + p": [WindowManager.set_layout, 2],
+    "Mod1 + u": [WindowManager.set_layout, 3],
     "Ctrl + Shift + Mod1 + Right": [WindowManager.resize_frame, 25, 0],
     "Ctrl + Shift + Mod1 + Left": [WindowManager.resize_frame, -25, 0],
     "Ctrl + Shift + Mod1 + Up": [WindowManager.resize_frame, 0, 25],
     "Ctrl + Shift + Mod1 + Down": [WindowManager.resize_frame, 0, -25],
 }
 
-EventHandler(layouts, keybinds).run()
+if len(sys.argv) == 3 and sys.argv[1] == "--replay":
+    tracing.replay(sys.argv[2], layouts, keybinds)
+else:
+    handler = EventHandler(layouts, keybinds)
+    if len(sys.argv) == 3 and sys.argv[1] == "--record":
+        handler.record(sys.argv[2])
+    handler.run()
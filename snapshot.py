@@ -0,0 +1,103 @@
+import marshal
+import os
+import stat
+import tempfile
+
+
+version = 1
+
+
+def get_directory():
+    # The snapshot is unmarshalled on load, so it only lives in a directory
+    # no other user can write to.
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if not directory:
+        cache = os.environ.get("XDG_CACHE_HOME") \
+            or os.path.expanduser("~/.cache")
+        directory = os.path.join(cache, "perhapswm")
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        except OSError as e:
+            print(e)
+            return None
+
+    try:
+        info = os.stat(directory)
+    except OSError as e:
+        print(e)
+        return None
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        print("Not using {} for snapshots, it is not private".format(
+            directory))
+        return None
+    return directory
+
+
+def get_path():
+    directory = get_directory()
+    if directory is None:
+        return None
+    display = os.environ.get("DISPLAY", ":0").replace("/", "_")
+    return os.path.join(directory, "perhapswm{}.snapshot".format(display))
+
+
+def save(state, path=None):
+    if path is None:
+        path = get_path()
+        if path is None:
+            return
+    state["version"] = version
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                     prefix=".snapshot")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(state, f)
+        os.replace(temporary, path)
+    except (OSError, ValueError) as e:
+        print(e)
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+
+def load(path=None):
+    if path is None:
+        path = get_path()
+        if path is None:
+            return None
+    # The file is removed whatever it holds, so a bad snapshot is not
+    # tried again on the next start.
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(e)
+        remove(path)
+        return None
+
+    try:
+        with os.fdopen(fd, "rb") as f:
+            info = os.fstat(f.fileno())
+            if info.st_uid != os.getuid() or not stat.S_ISREG(info.st_mode):
+                print("Ignoring snapshot {} not owned by this user".format(
+                    path))
+                return None
+            state = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        print(e)
+        return None
+    finally:
+        remove(path)
+
+    if not isinstance(state, dict) or state.get("version") != version:
+        return None
+    return state
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
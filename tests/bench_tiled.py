@@ -0,0 +1,24 @@
+# Run from the repository root: python -m tests.bench_tiled
+
+import time
+
+from layouts.tiled import Layout
+
+
+def bench(n):
+    layout = Layout(1920, 1080 + n * 125)
+    start = time.perf_counter()
+    for fid in range(1, n + 1):
+        layout.append_frame(0, fid, None)
+    for fid in range(2, n + 1):
+        layout.resize_frame(0, fid, 3, 7, "NW" if fid % 2 else "SE")
+        layout.get_dimensions(0)
+    for fid in range(1, n + 1):
+        layout.remove_frame(0, fid)
+    return (time.perf_counter() - start) / (3 * n)
+
+
+if __name__ == "__main__":
+    for n in (10, 100, 1000):
+        print("{:>5} frames {:>10.3f} ms per operation".format(
+            n, bench(n) * 1000))
@@ -0,0 +1,60 @@
+import random
+
+from layouts.bsp import Layout
+
+
+def check_sizes(layout, workspace):
+    x, y, width, height = layout.get_dimensions(workspace)
+    assert set(width) == set(layout.order.get(workspace, ()))
+    for fid in width:
+        assert width[fid] >= layout.min_width
+        assert height[fid] >= layout.min_height
+        assert x[fid] >= layout.gap and y[fid] >= layout.gap
+        assert x[fid] + width[fid] <= layout.root_width - layout.gap
+        assert y[fid] + height[fid] <= layout.root_height - layout.gap
+
+
+def test_minimum_size():
+    for n in range(1, 60):
+        layout = Layout(1920, 1080)
+        for fid in range(1, n + 1):
+            layout.append_frame(0, fid, None)
+        check_sizes(layout, 0)
+
+
+def test_minimum_size_random():
+    rand = random.Random(0)
+    layout = Layout(1920, 1080)
+    fids = []
+    for fid in range(1, 400):
+        if fids and rand.random() < 0.3:
+            layout.remove_frame(0, fids.pop(rand.randrange(len(fids))))
+        else:
+            layout.append_frame(0, fid, None)
+            fids.append(fid)
+        if fids:
+            layout.resize_frame(0, rand.choice(fids), rand.randint(-300, 300),
+                                rand.randint(-300, 300),
+                                rand.choice(["NW", "NE", "SW", "SE"]))
+        if rand.random() < 0.05:
+            layout.set_root_size(rand.randint(250, 2560),
+                                 rand.randint(250, 1440))
+        check_sizes(layout, 0)
+
+
+def test_splits_largest_frame():
+    layout = Layout(1920, 1080)
+    for fid in range(1, 5):
+        layout.append_frame(0, fid, None)
+    _, _, width, height = layout.get_dimensions(0)
+    areas = [width[fid] * height[fid] for fid in range(1, 5)]
+    assert max(areas) <= 2 * min(areas)
+
+
+def test_state_round_trip():
+    layout = Layout(1920, 1080)
+    for fid in range(1, 30):
+        layout.append_frame(0, fid, None)
+    copy = Layout(1920, 1080)
+    copy.set_state(layout.get_state())
+    assert copy.get_dimensions(0) == layout.get_dimensions(0)
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("xcffib")
+
+from layout import LayoutManager
+from layouts import floating, tiled
+
+
+class Connection:
+
+    def __init__(self):
+        self.sizes = {}
+        self.positions = {}
+        self.mapped = set()
+
+    def get_size(self, wid):
+        return self.sizes.get(wid, (400, 300))
+
+    def configure_window(self, wid, **kwargs):
+        if "x" in kwargs:
+            self.positions[wid] = (kwargs["x"], kwargs["y"])
+        if "width" in kwargs:
+            self.sizes[wid] = (kwargs["width"], kwargs["height"])
+
+    def update_corners(self, wid, top, bottom):
+        pass
+
+    def map_window(self, wid):
+        self.mapped.add(wid)
+
+    def unmap_window(self, wid):
+        self.mapped.discard(wid)
+
+    def set_input_focus(self, wid):
+        pass
+
+
+def manager(layouts):
+    conn = Connection()
+    lm = LayoutManager(conn, layouts,
+                       [(0, 0, 800, 600), (800, 0, 1024, 768)])
+    return conn, lm
+
+
+def add(conn, lm, fid, wid, size=(300, 200)):
+    conn.sizes[wid] = size
+    lm.append_frame(fid, wid)
+    lm.append_client(fid, wid)
+    lm.set_focused_frame(fid)
+
+
+def test_move_to_output_keeps_floating_size():
+    conn, lm = manager([floating, tiled])
+    add(conn, lm, 1, 11)
+    first, second = lm.outputs
+    assert conn.get_size(1) == (300, 234)
+
+    for _ in range(3):
+        lm.move_to_output(1, second)
+        lm.move_to_output(1, first)
+    lm.move_to_output(1, second)
+
+    assert lm.frames_fid[1].output is second
+    assert conn.get_size(1) == (300, 234)
+    assert conn.positions[1][0] >= 800
+    assert 1 not in first.history
+    assert 1 in lm.index.stack
+
+
+def test_removed_output_moves_frames():
+    conn, lm = manager([tiled])
+    first, second = lm.outputs
+    add(conn, lm, 1, 11)
+    lm.set_output(second)
+    add(conn, lm, 2, 12)
+    lm.set_workspace(3)
+    add(conn, lm, 3, 13)
+
+    lm.set_outputs([(0, 0, 800, 600)])
+
+    assert lm.outputs == [first]
+    assert lm.output is first
+    assert list(first.workspaces[0]) == [1, 2]
+    assert list(first.workspaces[3]) == [3]
+    assert lm.frames_fid[3].workspace == 3
+    assert 2 in conn.mapped and 3 not in conn.mapped
+    assert lm.index.stack[2] > lm.index.stack[1]
+    x, y = conn.positions[2]
+    assert lm.frame_at(x + 1, y + 1) == 2
+
+
+def test_unchanged_output_is_left_alone():
+    conn, lm = manager([tiled])
+    first, second = lm.outputs
+    add(conn, lm, 1, 11)
+    conn.positions.clear()
+
+    lm.set_outputs([(0, 0, 800, 600), (800, 0, 1280, 1024)])
+
+    assert lm.outputs == [first, second]
+    assert second.get_rect() == (800, 0, 1280, 1024)
+    assert 1 not in conn.positions
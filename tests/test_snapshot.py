@@ -0,0 +1,40 @@
+import os
+
+import snapshot
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "wm.snapshot")
+    snapshot.save({"layout": {"frames": {1: ([2, 3], True, 0, 0)}}}, path)
+    state = snapshot.load(path)
+    assert state["layout"]["frames"][1] == ([2, 3], True, 0, 0)
+    assert not os.path.exists(path)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_corrupt_snapshot_is_removed(tmp_path):
+    path = tmp_path / "wm.snapshot"
+    path.write_bytes(b"\xff\x00garbage")
+    assert snapshot.load(str(path)) is None
+    assert not path.exists()
+
+
+def test_symlink_is_not_followed(tmp_path):
+    target = tmp_path / "target"
+    snapshot.save({"layout": None}, str(target))
+    path = tmp_path / "wm.snapshot"
+    path.symlink_to(target)
+    assert snapshot.load(str(path)) is None
+    assert not os.path.lexists(str(path))
+    assert target.exists()
+
+
+def test_private_directory(tmp_path, monkeypatch):
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    directory = snapshot.get_directory()
+    assert directory == str(tmp_path / "perhapswm")
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+    os.chmod(directory, 0o755)
+    assert snapshot.get_path() is None
@@ -0,0 +1,78 @@
+import random
+
+from layouts.tiled import Layout, fit_min
+
+
+def converge(sizes, minimum):
+    # The iterative version fit_min replaced, used as the reference.
+    sizes = list(sizes)
+    too_small = []
+    for _ in range(10000):
+        w = 0
+        for i in range(len(sizes)):
+            if sizes[i] < minimum:
+                w += minimum - sizes[i]
+                sizes[i] = minimum
+                too_small.append(i)
+        if not w:
+            return sizes
+        good = [i for i in range(len(sizes)) if i not in too_small]
+        if not good:
+            return None
+        for i in good:
+            sizes[i] -= w / len(good)
+    return None
+
+
+def test_fit_min_random():
+    rand = random.Random(0)
+    minimum = 100
+    for _ in range(5000):
+        n = rand.randint(1, 30)
+        sizes = [rand.uniform(-200, 600) for _ in range(n)]
+        fitted = fit_min(list(sizes), minimum)
+
+        assert len(fitted) == n
+        assert abs(sum(fitted) - sum(sizes)) < 1e-6
+        if sum(sizes) <= n * minimum:
+            continue
+
+        assert min(fitted) >= minimum - 1e-6
+        for before, after in zip(sizes, fitted):
+            if before >= minimum:
+                assert after <= before + 1e-9
+        reference = converge(sizes, minimum)
+        if reference:
+            for a, b in zip(reference, fitted):
+                assert abs(a - b) < 1e-6
+
+
+def test_fit_min_infeasible():
+    assert fit_min([50, 50, 50], 100) == [50, 50, 50]
+    assert fit_min([], 100) == []
+
+
+def test_layout_heights():
+    rand = random.Random(1)
+    layout = Layout(1920, 1080)
+    fids = []
+    for fid in range(1, 9):
+        layout.append_frame(0, fid, None)
+        fids.append(fid)
+        for _ in range(5):
+            f = rand.choice(fids)
+            layout.resize_frame(0, f, rand.randint(-50, 50),
+                                rand.randint(-50, 50),
+                                rand.choice(["NW", "NE", "SW", "SE"]))
+
+        x, y, width, height = layout.get_dimensions(0)
+        stack = fids[1:]
+        for f in stack:
+            assert height[f] >= layout.min_height - 1
+        if stack:
+            bottom = y[stack[-1]] + height[stack[-1]]
+            assert bottom == layout.root_height - layout.gap
+
+    for fid in list(fids):
+        layout.remove_frame(0, fid)
+    assert 0 not in layout.order
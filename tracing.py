@@ -0,0 +1,365 @@
+import asyncio
+import marshal
+import struct
+import time
+
+import xcffib
+from xcffib.randr import NotifyEvent, ScreenChangeNotifyEvent
+from xcffib.xproto import ButtonPressEvent, ButtonReleaseEvent, \
+    ClientMessageEvent, ConfigureNotifyEvent, ConfigureRequestEvent, \
+    DestroyNotifyEvent, EnterNotifyEvent, KeyPressEvent, MapNotifyEvent, \
+    MapRequestEvent, MotionNotifyEvent, PropertyNotifyEvent, WindowError
+
+import events
+import x
+import wm
+
+
+HEADER = 0
+EVENT = 1
+BATCH = 2
+KEYBIND = 3
+REPLY = 4
+SIGNAL = 5
+
+record_struct = struct.Struct("<BI")
+keybind_struct = struct.Struct("<BH")
+
+event_types = (
+    MapRequestEvent, MapNotifyEvent, DestroyNotifyEvent,
+    ConfigureRequestEvent, ConfigureNotifyEvent, KeyPressEvent,
+    ButtonPressEvent, ButtonReleaseEvent, MotionNotifyEvent,
+    PropertyNotifyEvent, ClientMessageEvent, EnterNotifyEvent,
+    ScreenChangeNotifyEvent, NotifyEvent
+)
+
+
+def plain(value):
+    if isinstance(value, dict):
+        return {plain(k): plain(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    elif isinstance(value, bool):
+        return bool(value)
+    elif isinstance(value, int):
+        return int(value)
+    elif isinstance(value, float):
+        return float(value)
+    elif isinstance(value, str):
+        return str(value)
+    return None
+
+
+class Recorder:
+
+    def __init__(self, path, conn):
+        self.file = open(path, "wb")
+        self.write(HEADER, marshal.dumps({
+            "root": [conn.root, conn.root_width, conn.root_height],
+            "outputs": plain(conn.outputs),
+            "min_keycode": conn.conn.get_setup().min_keycode,
+            "keycodes": plain(conn.keycodes),
+            "atoms": plain(conn.atoms)
+        }))
+
+    def write(self, kind, payload=b""):
+        self.file.write(record_struct.pack(kind, len(payload)))
+        self.file.write(payload)
+
+    def event(self, event):
+        if type(event) in event_types:
+            index = event_types.index(type(event))
+            self.write(EVENT, bytes([index]) + event.pack())
+
+    def batch(self):
+        self.write(BATCH)
+        self.file.flush()
+
+    def keybind(self, code, mods):
+        self.write(KEYBIND, keybind_struct.pack(code, mods))
+
+    def reply(self, method, value):
+        self.write(REPLY, marshal.dumps((method, plain(value))))
+
+    def signal(self, signal, args):
+        self.write(SIGNAL, marshal.dumps((signal, plain(args))))
+
+    def close(self):
+        self.file.close()
+
+
+def read(path):
+    records = []
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = 0
+    while offset + record_struct.size <= len(data):
+        kind, length = record_struct.unpack_from(data, offset)
+        offset += record_struct.size
+        payload = data[offset:offset + length]
+        offset += length
+
+        if kind in (HEADER, REPLY, SIGNAL):
+            records.append((kind, marshal.loads(payload)))
+        elif kind == EVENT:
+            unpacker = xcffib.MemoryUnpacker(payload[1:])
+            records.append((kind, event_types[payload[0]](unpacker)))
+        elif kind == KEYBIND:
+            records.append((kind, keybind_struct.unpack(payload)))
+        else:
+            records.append((kind, None))
+
+    return records
+
+
+class NullValue:
+
+    def to_utf8(self):
+        return ""
+
+    def to_string(self):
+        return ""
+
+    def to_atoms(self):
+        return []
+
+
+class NullReply:
+
+    value = NullValue()
+
+    def __getattr__(self, name):
+        return 0
+
+
+class NullCookie:
+
+    def __init__(self, reply):
+        self.value = reply
+
+    def reply(self):
+        return self.value
+
+    def discard_reply(self):
+        pass
+
+
+class NullCore:
+
+    def __init__(self, header):
+        self.header = header
+
+    def GetKeyboardMapping(self, first, count):
+        reply = NullReply()
+        reply.keysyms_per_keycode = 1
+        reply.keysyms = [0] * count
+        for sym, code in self.header["keycodes"].items():
+            if first <= code < first + count:
+                reply.keysyms[code - first] = sym
+        return NullCookie(reply)
+
+    def InternAtom(self, only_if_exists, length, name):
+        reply = NullReply()
+        reply.atom = self.header["atoms"].get(name, 0)
+        return NullCookie(reply)
+
+    def __getattr__(self, request):
+        def send(*args, **kwargs):
+            return NullCookie(NullReply())
+        return send
+
+
+class NullConnection:
+
+    def __init__(self, header):
+        root, width, height = header["root"]
+        screen = NullReply()
+        screen.root = root
+        screen.width_in_pixels = width
+        screen.height_in_pixels = height
+
+        self.setup = NullReply()
+        self.setup.roots = [screen]
+        self.setup.min_keycode = header["min_keycode"]
+        self.setup.max_keycode = max(
+            list(header["keycodes"].values()) + [header["min_keycode"]]
+        )
+
+        self.pref_screen = 0
+        self.core = NullCore(header)
+        self.next_id = 1
+
+    def get_setup(self):
+        return self.setup
+
+    def generate_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def poll_for_event(self):
+        return None
+
+    def flush(self):
+        pass
+
+
+class Connection(x.Connection):
+
+    def __init__(self, header):
+        self.header = header
+        x.Connection.__init__(self, NullConnection(header))
+
+    def get_shape_extension(self):
+        return self.conn.core
+
+    def get_outputs(self):
+        _, width, height = self.header["root"]
+        outputs = self.header.get("outputs", [[0, 0, width, height]])
+        self.outputs = [tuple(o) for o in outputs]
+        return self.outputs
+
+    def select_output_changes(self):
+        pass
+
+
+class Decorations:
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.signals = {}
+
+    def start(self, loop, run_signal=None):
+        pass
+
+    def connect_signal(self, signal, handler):
+        self.signals[signal] = handler
+
+    def flush(self):
+        pass
+
+    def __getattr__(self, method):
+        def call(*args):
+            future = asyncio.get_running_loop().create_future()
+            if self.replies.get(method):
+                future.set_result(self.replies[method].pop(0))
+            else:
+                future.set_result(None)
+            return future
+        return call
+
+
+skipped = (
+    wm.WindowManager.execute, wm.WindowManager.restart, wm.WindowManager.quit
+)
+
+
+class Replay:
+
+    def __init__(self, path, layouts, keybinds):
+        self.records = read(path)
+        header = self.records[0][1]
+
+        replies = {}
+        for kind, value in self.records:
+            if kind == REPLY:
+                replies.setdefault(value[0], []).append(value[1])
+
+        self.handler = events.EventHandler(
+            layouts, keybinds, Connection(header), Decorations(replies)
+        )
+        self.handler.recorder = self
+        self.handler.spawn = self.spawn
+        self.handler.wm.drag_rate = 0
+        for code in self.handler.kb:
+            for mods in self.handler.kb[code]:
+                if self.handler.kb[code][mods][0] in skipped:
+                    self.handler.kb[code][mods][0] = self.skip
+
+        self.keybinds = 0
+        self.times = {}
+        self.tasks = []
+
+    def skip(self, *args):
+        pass
+
+    def event(self, event):
+        pass
+
+    def batch(self):
+        pass
+
+    def keybind(self, code, mods):
+        self.keybinds += 1
+
+    def reply(self, method, value):
+        pass
+
+    def signal(self, signal, args):
+        pass
+
+    def spawn(self, result):
+        task = events.EventHandler.spawn(self.handler, result)
+        if task is not None:
+            self.tasks.append(task)
+
+    def measure(self, name, elapsed):
+        count, total, worst = self.times.get(name, (0, 0, 0))
+        self.times[name] = (count + 1, total + elapsed, max(worst, elapsed))
+
+    async def handle_events(self, events):
+        # Same as EventHandler.handle_events, but every event is timed on
+        # its own, up to the end of the tasks it spawned.
+        handler = self.handler
+        handler.conn.begin_batch()
+        try:
+            for event in events:
+                start = time.perf_counter()
+                try:
+                    handler.handle_event(event)
+                except WindowError as e:
+                    print(e)
+                if self.tasks:
+                    tasks = self.tasks
+                    self.tasks = []
+                    await asyncio.wait(tasks)
+                self.measure(type(event).__name__,
+                             time.perf_counter() - start)
+        finally:
+            handler.conn.end_batch()
+        handler.wm.decorations.flush()
+        if handler.drag_timer is None:
+            handler.commit_drag()
+
+    async def main(self):
+        batch = []
+        for kind, value in self.records:
+            if kind == EVENT:
+                batch.append(value)
+            elif kind == BATCH and batch:
+                await self.handle_events(self.handler.coalesce(batch))
+                batch = []
+            elif kind == SIGNAL:
+                signal, args = value
+                start = time.perf_counter()
+                self.handler.run_signal(
+                    self.handler.wm.decorations.signals[signal], args)
+                await asyncio.sleep(0)
+                self.measure(signal, time.perf_counter() - start)
+
+    def run(self):
+        start = time.perf_counter()
+        asyncio.run(self.main())
+        elapsed = time.perf_counter() - start
+
+        recorded = len([r for r in self.records if r[0] == KEYBIND])
+        print("Replayed in {:.1f} ms, {} of {} keybinds".format(
+            elapsed * 1000, self.keybinds, recorded))
+        for name in sorted(self.times):
+            count, total, worst = self.times[name]
+            print("{:<24} {:>6} {:>10.3f} ms {:>10.3f} ms".format(
+                name, count, total / count * 1000, worst * 1000))
+
+
+def replay(path, layouts, keybinds):
+    Replay(path, layouts, keybinds).run()
@@ -1,8 +1,7 @@
 
-import dbus
-import sys
 import os
-import subprocess
+import sys
+import time
 
 from xcffib.xproto import ButtonIndex, ButtonPressEvent, \
     ConfigureRequestEvent, DestroyNotifyEvent, EventMask, \
@@ -10,7 +9,16 @@ from xcffib.xproto import ButtonIndex, ButtonPressEvent, \
     StackMode, WindowError
 
 from layout import LayoutManager
+from launcher import Launcher
+import bus
 import decorations
+import snapshot
+
+
+def start_decorations(name="org.wm.Frames"):
+    if bus.has_owner(name):
+        return None
+    return decorations.run()
 
 
 class WindowManager:
@@ -19,7 +27,10 @@ class WindowManager:
 
         self.conn = connection
 
+        self.launcher = Launcher()
         self.unmapped = {}
+        self.appending = 0
+        self.held = []
         self.next_is_tab = False
         self.bg_prev_size = None
 
@@ -32,15 +43,22 @@ class WindowManager:
         self.change_y = 0
         self.corner = ""
         self.grid = False
+        self.pointer_x = None
+        self.pointer_y = None
+        self.drag_rate = 40
+        self.drag_time = 0
+        self.drag_motions = 0
+        self.drag_commits = 0
+        self.drag_stats = []
 
-        self.lm = LayoutManager(
-            self.conn, layouts, self.conn.root_width, self.conn.root_height
-        )
+        self.lm = LayoutManager(self.conn, layouts, self.conn.get_outputs())
 
         self.conn.set_event_mask(
             self.conn.root,
             EventMask.SubstructureNotify | EventMask.SubstructureRedirect
+            | EventMask.StructureNotify
         )
+        self.conn.select_output_changes()
         self.conn.grab_button_press(self.conn.root, ButtonIndex.Any,
                                     ModMask.Any)
         self.conn.grab_button_release(self.conn.root, ButtonIndex._1,
@@ -48,29 +66,85 @@ class WindowManager:
         self.conn.grab_button_release(self.conn.root, ButtonIndex._3,
                                       ModMask._1)
 
-        self.decorations = self.connect_dbus(
-            "org.wm.Frames", "/org/wm/Frames"
-        )
+        self.decorations = None
+
+    def connect_decorations(self, decorations=None, ready=None):
+        if decorations is None:
+            decorations = self.connect_dbus("org.wm.Frames", "/org/wm/Frames",
+                                            ready)
+        self.decorations = decorations
+        self.decorations.connect_signal("tab_moved", self.tab_moved)
+        self.decorations.connect_signal("tab_closed", self.tab_closed)
+
+    def connect_dbus(self, name, path, ready=None):
+        decorations.wait(ready)
+        return bus.Service(name, path, decorations.batch_methods)
+
+    def load_state(self, adopt=True):
+        # A snapshot only describes frames of a decorations process that
+        # was already running; otherwise it is stale and just removed.
+        state = snapshot.load()
+        if state and adopt:
+            self.restore(state)
+
+    def get_state(self):
+        return {
+            "layout": self.lm.get_state(),
+            "children": list(self.launcher.children),
+            "next_is_tab": self.next_is_tab
+        }
+
+    def restore(self, state):
+        self.lm.set_state(state["layout"])
+        self.launcher.adopt(state["children"])
+        self.next_is_tab = state["next_is_tab"]
+
+        # Frames and clients that went away while no WM was running are
+        # dropped; the rest are adopted where they are.
+        children = self.conn.get_children(self.lm.get_fids())
+        for fid in self.lm.get_fids():
+            frame = self.lm.frames_fid[fid]
+            for wid in list(frame.history):
+                if children[fid] is None or wid not in children[fid]:
+                    self.lm.remove_client(fid, wid)
+            if not frame.history:
+                self.lm.remove_frame(fid)
+                if children[fid] is not None:
+                    self.decorations.remove_frame(fid)
+                continue
+
+            self.conn.set_event_mask(
+                fid, EventMask.SubstructureNotify | EventMask.PropertyChange
+                | EventMask.EnterWindow
+            )
+            for wid in frame.history:
+                self.conn.set_event_mask(
+                    wid, EventMask.PropertyChange | EventMask.StructureNotify)
 
-    def connect_dbus(self, name, path):
-        decorations.run()
-        try:
-            bus = dbus.SessionBus()
-            bus_obj = bus.get_object(name, path)
-            return dbus.Interface(bus_obj, name)
-        except dbus.DBusException as e:
-            sys.exit(e)
+        self.lm.set_outputs(self.conn.outputs)
+        for output in self.lm.outputs:
+            self.lm.update_layout(output)
+        fid = self.get_focused_fid()
+        if fid:
+            self.focus_frame(fid)
+        self.decorations.flush()
+
+    def save_state(self):
+        snapshot.save(self.get_state())
+        self.conn.flush_pending()
 
-    def map_request(self, wid):
+    async def map_request(self, wid):
         role = self.conn.get_window_role(wid)
         if role == "grid":
             self.conn.map_window(wid)
         else:
             if wid in self.unmapped:
                 self.map_unmapped(wid)
+            elif self.appending:
+                self.held.append(wid)
             else:
                 if not self.lm.get_n_frames() or not self.next_is_tab:
-                    self.append_unmapped(wid)
+                    await self.append_unmapped(wid)
                 else:
                     self.map_new_tab(wid)
 
@@ -96,10 +170,21 @@ class WindowManager:
 
         del self.unmapped[fid]
 
-    def append_unmapped(self, wid):
-        fid = self.decorations.append_frame()
-        self.append_tab(fid, wid)
-        self.unmapped[fid] = wid
+    async def append_unmapped(self, wid):
+        # A MapRequest that arrives while a frame is being created may be
+        # for that frame, so it is held until the frame's id is known.
+        self.appending += 1
+        try:
+            fid = await self.decorations.append_frame()
+            self.append_tab(fid, wid)
+            self.unmapped[fid] = wid
+        finally:
+            self.appending -= 1
+            if not self.appending:
+                held = self.held
+                self.held = []
+                for w in held:
+                    await self.map_request(w)
 
     def map_new_tab(self, wid):
         fid = self.get_focused_fid()
@@ -119,71 +204,55 @@ class WindowManager:
         self.decorations.append_tab(fid, wid, name, classes)
 
     def set_name(self, wid):
-        if self.lm.client_exists(wid):
+        if wid in self.lm.frames_wid:
             fid = self.lm.get_fid(wid)
             name = self.conn.get_window_name(wid)
             self.decorations.set_tab_name(fid, wid, name)
 
     def set_icon_name(self, wid):
-        if self.lm.client_exists(wid):
+        if wid in self.lm.frames_wid:
             fid = self.lm.get_fid(wid)
             classes = self.conn.get_window_classes(wid)
             name = self.conn.get_window_name(wid)
             self.decorations.set_tab_icon(fid, wid, classes, name)
 
-    def handle_property_normal_hints(self, fid):
-        if self.lm.frame_exists(fid):
-            wids = self.decorations.get_wids()
-            if wids and fid in wids:
-                cwids = []
-                for cwid in self.lm.get_frame(fid).history:
-                    cwids.append(cwid)
-                for cwid in cwids:
-                    if cwid not in wids[fid]:
-                        fid2 = 0
-                        for f in wids:
-                            if f != fid:
-                                for w in wids[f]:
-                                    if w == cwid:
-                                        fid2 = f
-                                        wid = w
-                        if fid2:
-                            self.move_tab(fid, fid2, wid)
-                        else:
-                            self.conn.close_window(cwid)
-
-    def update_tab_order(self, fid):
+    def tab_moved(self, fid, fid2, wid):
+        if self.lm.frame_exists(fid) and self.lm.frame_exists(fid2) \
+                and self.lm.get_fid(wid) == fid:
+            self.move_tab(fid, fid2, wid)
+
+    def tab_closed(self, fid, wid):
+        if wid in self.lm.frames_wid:
+            self.conn.close_window(wid)
+
+    async def update_tab_order(self, fid):
         if self.lm.frame_exists(fid):
-            wid = int(self.decorations.get_active_client(fid))
-            if wid and wid != self.lm.get_frame(wid).history[-1]:
+            wid = int(await self.decorations.get_active_client(fid))
+            if wid and self.lm.client_exists(wid) \
+                    and wid != self.lm.get_frame(wid).history[-1]:
                 self.show_tab(wid)
 
-    def check_tab_amount(self, event):
-        data = event.data.data32
-        if data[0] == 3 and not sum(data[1:]):
-            fid = event.window
-            dwids = self.decorations.get_wids()
-            if dwids and fid in dwids:
-                wids = self.lm.get_frame(fid).history
-                if len(dwids[fid]) < len(wids):
-                    for w in wids:
-                        if w not in dwids[fid]:
-                            self.conn.close_window(w)
-
     def toggle_next_tab(self):
         self.next_is_tab = not self.next_is_tab
 
     def close_tab(self, wid):
-        if self.lm.client_exists(wid):
-            frame = self.lm.get_frame(wid)
-            if len(frame.history) <= 1:
+        # The client may be on a hidden workspace or another output.
+        if wid in self.lm.frames_wid:
+            frame = self.lm.frames_wid[wid]
+            focused = frame.output is self.lm.output \
+                and self.lm.is_visible(frame)
+            self.lm.remove_client(frame.fid, wid)
+            if not frame.history:
                 self.lm.remove_frame(frame.fid)
                 self.decorations.remove_frame(frame.fid)
-                if self.lm.get_n_frames():
-                    self.focus_frame(self.lm.history[-1])
+                if focused and self.lm.get_n_frames():
+                    self.focus_frame(self.lm.output.history[-1])
             else:
-                self.lm.remove_client(frame.fid, wid)
-                self.show_tab(frame.history[-1])
+                if focused:
+                    self.show_tab(frame.history[-1])
+                else:
+                    self.conn.map_window(frame.history[-1])
+                    self.decorations.goto_tab(frame.fid, frame.history[-1])
                 self.decorations.remove_tab(frame.fid, wid)
             self.decorations.remove_color(wid)
 
@@ -232,14 +301,11 @@ class WindowManager:
             self.header_color(fid)
 
     def header_color(self, fid):
-        self.decorations.set_header_color(fid, True)
-        for f in self.lm.history:
-            if f != fid:
-                self.decorations.set_header_color(f, False)
+        self.decorations.set_focused_frame(fid)
 
     def get_focused_fid(self):
-        if self.lm.history:
-            return self.lm.history[-1]
+        if self.lm.output.history:
+            return self.lm.output.history[-1]
         else:
             return 0
 
@@ -249,13 +315,22 @@ class WindowManager:
                 event.window, x=event.x, y=event.y, width=event.width,
                 height=event.height, border=0
             )
+            self.lm.forget_window(event.window)
 
     # Key bindings:
 
     def execute(self, command):
-        if not os.fork():
-            subprocess.Popen(["/bin/sh", "-c", command])
-            os._exit(0)
+        self.launcher.spawn(command)
+
+    def restart(self):
+        self.save_state()
+        self.decorations.close()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def quit(self):
+        self.conn.flush_pending()
+        self.decorations.close()
+        sys.exit()
 
     def destroy(self):
         fid = self.get_focused_fid()
@@ -281,22 +356,22 @@ class WindowManager:
         if frame:
             self.focus_client(frame.history[-1])
 
-    def next_tab(self):
+    async def next_tab(self):
         fid = self.get_focused_fid()
         if fid:
-            wid = self.decorations.next_tab(fid)
+            wid = await self.decorations.next_tab(fid)
             self.show_tab(wid)
 
-    def prev_tab(self):
+    async def prev_tab(self):
         fid = self.get_focused_fid()
         if fid:
-            wid = self.decorations.prev_tab(fid)
+            wid = await self.decorations.prev_tab(fid)
             self.show_tab(wid)
 
-    def set_tab(self, n):
+    async def set_tab(self, n):
         fid = self.get_focused_fid()
         if fid:
-            wid = self.decorations.goto_tab_num(fid, n)
+            wid = await self.decorations.goto_tab_num(fid, n)
             if wid:
                 self.show_tab(wid)
 
@@ -354,7 +429,7 @@ class WindowManager:
             if self.lm.get_frame(fid):
                 self.show_tab(wid)
 
-    def detach_tab(self):
+    async def detach_tab(self):
         if self.lm.get_n_frames() > 0:
             fid = self.get_focused_fid()
             if len(self.lm.get_frame(fid).history) > 1:
@@ -364,7 +439,7 @@ class WindowManager:
                 self.decorations.remove_tab(fid, wid)
                 self.show_tab(self.lm.get_frame(fid).history[-1])
 
-                self.append_unmapped(wid)
+                await self.append_unmapped(wid)
                 self.show_tab(wid)
 
     def toggle_decorations(self):
@@ -388,12 +463,13 @@ class WindowManager:
         self.lm.set_workspace(id)
 
     def next_workspace(self):
-        if self.lm.workspace < self.lm.max_workspaces:
-            self.lm.set_workspace(self.lm.workspace + 1)
+        if self.lm.get_n_frames() \
+                or self.lm.output.workspace < self.lm.get_last_workspace():
+            self.lm.set_workspace(self.lm.output.workspace + 1)
 
     def prev_workspace(self):
-        if self.lm.workspace != 0:
-            self.lm.set_workspace(self.lm.workspace - 1)
+        if self.lm.output.workspace != 0:
+            self.lm.set_workspace(self.lm.output.workspace - 1)
 
     def move_frame_workspace(self, id):
         fid = self.get_focused_fid()
@@ -401,12 +477,25 @@ class WindowManager:
             self.lm.move_to_workspace(fid, id)
 
     def move_frame_next_workspace(self):
-        if self.lm.workspace < self.lm.max_workspaces:
-            self.move_frame_workspace(self.lm.workspace + 1)
+        self.move_frame_workspace(self.lm.output.workspace + 1)
 
     def move_frame_prev_workspace(self):
-        if self.lm.workspace != 0:
-            self.move_frame_workspace(self.lm.workspace - 1)
+        if self.lm.output.workspace != 0:
+            self.move_frame_workspace(self.lm.output.workspace - 1)
+
+    def next_output(self):
+        frame = self.lm.set_output(self.lm.get_next_output())
+        if frame:
+            self.focus_client(frame.history[-1])
+
+    def move_frame_next_output(self):
+        fid = self.get_focused_fid()
+        if fid and len(self.lm.outputs) > 1:
+            self.lm.move_to_output(fid, self.lm.get_next_output())
+            self.focus_frame(fid)
+
+    def update_outputs(self):
+        self.lm.set_outputs(self.conn.get_outputs())
 
     def set_layout(self, id):
         self.lm.set_layout(id)
@@ -414,55 +503,77 @@ class WindowManager:
     def button_press(self, event):
         fid = self.get_focused_fid()
         if fid and not self.drag and event.state == ModMask._1 \
-                and self.conn.is_inside(fid, event.event_x, event.event_y):
+                and self.lm.is_inside(fid, event.event_x, event.event_y):
             for i in [ButtonIndex._1, ButtonIndex._3]:
                 if event.detail == i:
                     self.drag = i
                     self.drag_frame = fid
                     self.start_x = event.event_x
                     self.start_y = event.event_y
-                    self.corner = self.conn.get_corner(fid, self.start_x,
-                                                       self.start_y)
-
-    def button_motion(self, event):
+                    self.pointer_x = event.event_x
+                    self.pointer_y = event.event_y
+                    self.corner = self.lm.get_corner(fid, self.start_x,
+                                                     self.start_y)
+                    self.drag_motions = 0
+                    self.drag_commits = 0
+                    self.drag_time = 0
+                    self.conn.grab_pointer(self.conn.root)
+
+    def button_motion(self, event, count=1):
         if self.drag:
-            self.change_x += event.event_x - self.start_x
-            self.change_y += event.event_y - self.start_y
-
-            x = 0
-            y = 0
-            if self.change_x >= self.min_change:
-                x += self.min_change
-                self.change_x -= self.min_change
-            elif self.change_x <= -self.min_change:
-                x -= self.min_change
-                self.change_x += self.min_change
-            if self.change_y >= self.min_change:
-                y += self.min_change
-                self.change_y -= self.min_change
-            elif self.change_y <= -self.min_change:
-                y -= self.min_change
-                self.change_y += self.min_change
-
-            self.start_x = event.event_x
-            self.start_y = event.event_y
-
-            if x or y:
-                if self.drag == ButtonIndex._1:
-                    self.lm.move(self.drag_frame, x, y)
-                elif self.drag == ButtonIndex._3:
-                    self.lm.resize(self.drag_frame, x, y, self.corner)
-
-                if not self.grid:
-                    self.decorations.show_grid()
-                    self.grid = True
-
-                    for fid in self.lm.history:
-                        self.conn.configure_window(fid, border=3)
-                        self.conn.set_border_color_white(fid)
+            self.drag_motions += count
+            self.pointer_x = event.event_x
+            self.pointer_y = event.event_y
+
+    def commit_drag(self, force=False):
+        if not self.drag or (self.pointer_x == self.start_x
+                             and self.pointer_y == self.start_y):
+            return None
+
+        now = time.monotonic()
+        if self.drag_rate and not force:
+            wait = self.drag_time + 1 / self.drag_rate - now
+            if wait > 0:
+                return wait
+        self.drag_time = now
+
+        self.change_x += self.pointer_x - self.start_x
+        self.change_y += self.pointer_y - self.start_y
+        self.start_x = self.pointer_x
+        self.start_y = self.pointer_y
+
+        x = int(self.change_x / self.min_change) * self.min_change
+        y = int(self.change_y / self.min_change) * self.min_change
+        self.change_x -= x
+        self.change_y -= y
+
+        if x or y:
+            self.drag_commits += 1
+            if self.drag == ButtonIndex._1:
+                self.lm.move(self.drag_frame, x, y)
+            elif self.drag == ButtonIndex._3:
+                self.lm.resize(self.drag_frame, x, y, self.corner)
+
+            if not self.grid:
+                self.decorations.show_grid()
+                self.grid = True
+
+                for fid in self.lm.output.history:
+                    self.conn.configure_window(fid, border=3)
+                    self.conn.set_border_color_white(fid)
+
+        return None
 
     def button_release(self, event):
         if self.drag == event.detail:
+            self.pointer_x = event.event_x
+            self.pointer_y = event.event_y
+            self.commit_drag(True)
+            self.conn.ungrab_pointer()
+
+            self.drag_stats.append((self.drag_motions, self.drag_commits))
+            del self.drag_stats[:-100]
+
             self.drag = 0
             self.drag_frame = None
             self.start_x = None
@@ -471,7 +582,7 @@ class WindowManager:
             self.change_y = 0
             self.corner = ""
 
-            for fid in self.lm.history:
+            for fid in self.lm.output.history:
                 self.conn.configure_window(fid, border=0)
 
             self.decorations.hide_grid()
@@ -487,11 +598,9 @@ class WindowManager:
             self.lm.switch(fid1, fid2)
 
         if self.drag == ButtonIndex._1 and not fid2:
-            pointer = self.conn.conn.core.QueryPointer(fid1).reply()
-            for fid in self.lm.history:
-                if self.conn.is_inside(fid, pointer.root_x, pointer.root_y):
-                    self.lm.switch(fid1, fid)
-                    break
+            fid = self.lm.frame_at(event.root_x, event.root_y)
+            if fid and fid != fid1:
+                self.lm.switch(fid1, fid)
 
     def resize_frame(self, x, y):
         self.lm.resize(self.get_focused_fid(), x, -y, "SE")
@@ -1,10 +1,14 @@
 
+import os
+
 import xcffib
 from xcffib.xproto import Allow, Atom, ButtonIndex, ConfigWindow, \
     ClientMessageData, ClientMessageEvent, CW, EventMask, GrabMode, \
     InputFocus, ModMask, PropertyNotifyEvent, StackMode, Time, WindowError, \
     WindowClass
+import xcffib.randr
 import xcffib.shape
+import xcffib.xinerama
 from Xlib import XK
 
 
@@ -18,7 +22,11 @@ atom_names = (
     "_NET_WM_NAME",
     "WM_NAME",
     "WM_CLASS",
-    "WM_WINDOW_ROLE"
+    "WM_WINDOW_ROLE",
+    "WM_ICON_NAME",
+    "_NET_WM_ICON_NAME",
+    "_NET_WM_VISIBLE_ICON_NAME",
+    "_NET_WM_USER_TIME"
 )
 
 
@@ -32,36 +40,111 @@ configure_masks = {
 }
 
 
+geometry_keys = ("x", "y", "width", "height")
+
+
+class Geometry:
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
 class Connection:
 
-    def __init__(self):
-        self.conn = xcffib.connect()
+    def __init__(self, conn=None):
+        if conn is None:
+            conn = xcffib.connect()
+            os.set_inheritable(conn.get_file_descriptor(), False)
+        self.conn = conn
         self.default_screen = self.conn.get_setup() \
             .roots[self.conn.pref_screen]
         self.root = self.default_screen.root
         self.root_width = self.default_screen.width_in_pixels
         self.root_height = self.default_screen.height_in_pixels
-        self.keycodes = self.get_keycodes()
-        self.atoms = self.get_atoms(atom_names)
+
+        self.deferred = False
+        self.pending = 0
+        self.flush_requests = 0
+        self.flushes = 0
+        self.flushes_saved = 0
+
+        self.geometries = {}
+
+        self.properties = {}
+        self.property_hits = 0
+        self.property_misses = 0
+
+        self.shape = None
+        self.shape_gcs = None
+        self.shape_masks = {}
+        self.max_shape_masks = 32
+        self.shapes = {}
+
+        self.randr = None
+        self.randr_version = (0, 0)
+        self.outputs = []
+
+        keyboard_mapping = self.request_keyboard_mapping()
+        atom_cookies = self.request_atoms(atom_names)
+        self.keycodes = self.get_keycodes(keyboard_mapping)
+        self.atoms = self.get_atoms(atom_names, atom_cookies)
+
+    def get_file_descriptor(self):
+        return self.conn.get_file_descriptor()
 
     def get_next_event(self):
         return self.conn.wait_for_event()
 
+    def poll_next_event(self):
+        return self.conn.poll_for_event()
+
+    def flush(self):
+        self.flush_requests += 1
+        if self.deferred:
+            self.pending += 1
+        else:
+            self.conn.flush()
+            self.flushes += 1
+
+    def flush_pending(self):
+        if self.pending:
+            self.conn.flush()
+            self.flushes += 1
+            self.flushes_saved += self.pending - 1
+            self.pending = 0
+
+    def begin_batch(self):
+        self.deferred = True
+
+    def end_batch(self):
+        self.flush_pending()
+        self.deferred = False
+
+    def reply(self, cookie):
+        self.flush_pending()
+        return cookie.reply()
+
     def map_window(self, wid):
         self.conn.core.MapWindow(wid)
-        self.conn.flush()
+        self.flush()
 
     def unmap_window(self, wid):
         self.conn.core.UnmapWindow(wid)
-        self.conn.flush()
+        self.flush()
 
     def unmap_subwindows(self, wid):
         self.conn.core.UnmapSubwindows(wid)
-        self.conn.flush()
+        self.flush()
 
     def reparent_window(self, wid, parent):
         self.conn.core.ReparentWindow(wid, parent, 0, 0)
-        self.conn.flush()
+        self.flush()
+        if wid in self.geometries:
+            self.geometries[wid].x = 0
+            self.geometries[wid].y = 0
 
     def configure_window(self, wid, **kwargs):
         values = []
@@ -71,11 +154,50 @@ class Connection:
                 values.append(kwargs[key])
                 mask |= configure_masks[key]
         self.conn.core.ConfigureWindow(wid, mask, values)
-        self.conn.flush()
+        self.flush()
+        self.update_geometry(wid, **kwargs)
+
+    def get_geometry(self, wid):
+        if wid not in self.geometries:
+            r = self.reply(self.conn.core.GetGeometry(wid))
+            self.geometries[wid] = Geometry(r.x, r.y, r.width, r.height)
+        return self.geometries[wid]
+
+    def update_geometry(self, wid, **kwargs):
+        if wid in self.geometries:
+            geometry = self.geometries[wid]
+            for key in geometry_keys:
+                if key in kwargs:
+                    setattr(geometry, key, kwargs[key])
+        elif all(key in kwargs for key in geometry_keys):
+            self.geometries[wid] = Geometry(
+                kwargs["x"], kwargs["y"], kwargs["width"], kwargs["height"]
+            )
+
+    def forget_window(self, wid):
+        if wid in self.geometries:
+            del self.geometries[wid]
+        if wid in self.properties:
+            del self.properties[wid]
+        if wid in self.shapes:
+            del self.shapes[wid]
+
+    def get_children(self, wids):
+        cookies = {}
+        for wid in wids:
+            cookies[wid] = self.conn.core.QueryTree(wid)
+
+        children = {}
+        for wid in cookies:
+            try:
+                children[wid] = set(self.reply(cookies[wid]).children)
+            except WindowError:
+                children[wid] = None
+        return children
 
     def get_size(self, wid):
-        r = self.conn.core.GetGeometry(wid).reply()
-        return r.width, r.height
+        geometry = self.get_geometry(wid)
+        return geometry.width, geometry.height
 
     def close_window(self, wid):
         properties = self.get_property(wid, "WM_PROTOCOLS", "ATOM")
@@ -91,11 +213,16 @@ class Connection:
             self.conn.core.SendEvent(False, wid, EventMask.NoEvent, event)
         else:
             self.conn.core.KillClient(wid)
-        self.conn.flush()
+        self.flush()
 
     def set_event_mask(self, wid, mask):
         self.conn.core.ChangeWindowAttributes(wid, CW.EventMask, [mask])
-        self.conn.flush()
+        self.flush()
+        if mask & EventMask.PropertyChange:
+            if wid not in self.properties:
+                self.properties[wid] = {}
+        elif wid in self.properties:
+            del self.properties[wid]
 
     def grab_key(self, wid, key, mod):
         if isinstance(key, str):
@@ -108,14 +235,14 @@ class Connection:
         self.conn.core.GrabKey(
             False, wid, mod, keycode, GrabMode.Async, GrabMode.Async
         )
-        self.conn.flush()
+        self.flush()
 
     def grab_button_press(self, wid, button, mod):
         self.conn.core.GrabButton(
             True, wid, EventMask.ButtonPress, GrabMode.Sync, GrabMode.Async,
             Atom._None, Atom._None, button, mod
         )
-        self.conn.flush()
+        self.flush()
 
     def grab_button_release(self, wid, button, mod):
         self.conn.core.GrabButton(
@@ -123,17 +250,29 @@ class Connection:
             GrabMode.Async, GrabMode.Async, Atom._None, Atom._None, button,
             mod
         )
-        self.conn.flush()
+        self.flush()
+
+    def grab_pointer(self, wid):
+        self.conn.core.GrabPointer(
+            True, wid, EventMask.ButtonRelease | EventMask.ButtonMotion,
+            GrabMode.Async, GrabMode.Async, Atom._None, Atom._None,
+            Time.CurrentTime
+        ).discard_reply()
+        self.flush()
+
+    def ungrab_pointer(self):
+        self.conn.core.UngrabPointer(Time.CurrentTime)
+        self.flush()
 
     def replay_pointer(self, time):
         self.conn.core.AllowEvents(Allow.ReplayPointer, time)
-        self.conn.flush()
+        self.flush()
 
     def set_input_focus(self, wid):
         self.conn.core.SetInputFocus(
             InputFocus.PointerRoot, wid, Time.CurrentTime
         )
-        self.conn.flush()
+        self.flush()
 
     def get_window_name(self, wid):
         for n in ["_NET_WM_VISIBLE_NAME", "_NET_WM_NAME", "WM_NAME"]:
@@ -155,26 +294,47 @@ class Connection:
         return self.get_property(wid, "WM_WINDOW_ROLE", "STRING")
 
     def get_property(self, wid, property, type):
-        value = self.conn.core.GetProperty(
-            False, wid, self.atoms[property], self.atoms[type], 0,
-            (2 ** 32) - 1
-        ).reply().value
+        atom = self.atoms[property]
+        cache = self.properties.get(wid)
+        if cache is not None and atom in cache and cache[atom][0] == type:
+            self.property_hits += 1
+            return cache[atom][1]
+        self.property_misses += 1
+
+        value = self.reply(self.conn.core.GetProperty(
+            False, wid, atom, self.atoms[type], 0, (2 ** 32) - 1
+        )).value
         if type == "UTF8_STRING":
-            return value.to_utf8()
+            value = value.to_utf8()
         elif type == "STRING":
-            return value.to_string()
+            value = value.to_string()
         elif type == "ATOM":
-            return value.to_atoms()
-        raise ValueError(type)
+            value = value.to_atoms()
+        else:
+            raise ValueError(type)
+
+        if cache is not None:
+            cache[atom] = (type, value)
+        return value
+
+    def invalidate_property(self, wid, atom):
+        if wid in self.properties and atom in self.properties[wid]:
+            del self.properties[wid][atom]
 
     def string_to_keycode(self, string):
         return self.keycodes[XK.string_to_keysym(string)]
 
-    def get_keycodes(self):
+    def request_keyboard_mapping(self):
         setup = self.conn.get_setup()
         first = setup.min_keycode
         count = setup.max_keycode - first + 1
-        reply = self.conn.core.GetKeyboardMapping(first, count).reply()
+        return self.conn.core.GetKeyboardMapping(first, count)
+
+    def get_keycodes(self, cookie=None):
+        if cookie is None:
+            cookie = self.request_keyboard_mapping()
+        first = self.conn.get_setup().min_keycode
+        reply = self.reply(cookie)
 
         keycodes = {}
         for i in range(len(reply.keysyms) // reply.keysyms_per_keycode):
@@ -184,19 +344,26 @@ class Connection:
 
         return keycodes
 
-    def get_atoms(self, names):
+    def request_atoms(self, names):
+        cookies = {}
+        for n in names:
+            cookies[n] = self.conn.core.InternAtom(False, len(n), n)
+        return cookies
+
+    def get_atoms(self, names, cookies=None):
         try:
+            if cookies is None:
+                cookies = self.request_atoms(names)
             atoms = {}
             for n in names:
-                atoms[n] = self.conn.core.InternAtom(False, len(n), n) \
-                    .reply().atom
+                atoms[n] = self.reply(cookies[n]).atom
             return atoms
         except TypeError as e:
             print(e)
 
     def get_corner(self, wid, x, y):
         corner = ""
-        geometry = self.conn.core.GetGeometry(wid).reply()
+        geometry = self.get_geometry(wid)
         if y < geometry.y + geometry.height / 2:
             corner += "N"
         else:
@@ -208,61 +375,139 @@ class Connection:
         return corner
 
     def is_inside(self, wid, x, y):
-        geometry = self.conn.core.GetGeometry(wid).reply()
+        geometry = self.get_geometry(wid)
         if x >= geometry.x and x <= geometry.x + geometry.width \
                 and y >= geometry.y and y <= geometry.y + geometry.height:
             return True
         return False
 
+    def get_outputs(self):
+        cookies = [self.conn.core.QueryExtension(len(n), n)
+                   for n in ("RANDR", "XINERAMA")]
+        randr, xinerama = [self.reply(c).present for c in cookies]
+
+        outputs = []
+        if randr:
+            outputs = self.get_monitors()
+        if not outputs and xinerama:
+            outputs = self.get_xinerama_screens()
+        if not outputs:
+            geometry = self.get_geometry(self.root)
+            outputs = [(0, 0, geometry.width, geometry.height)]
+
+        self.outputs = list(dict.fromkeys(outputs))
+        return self.outputs
+
+    def get_monitors(self):
+        if self.randr is None:
+            self.randr = xcffib.randr.randrExtension(
+                        self.conn, key=xcffib.ExtensionKey("RANDR"))
+        version = self.reply(self.randr.QueryVersion(1, 5))
+        self.randr_version = (version.major_version, version.minor_version)
+        if self.randr_version < (1, 5):
+            return []
+
+        monitors = self.reply(self.randr.GetMonitors(self.root, True)).monitors
+        monitors = sorted(monitors, key=lambda m: not m.primary)
+        return [(m.x, m.y, m.width, m.height) for m in monitors]
+
+    def get_xinerama_screens(self):
+        xinerama = xcffib.xinerama.xineramaExtension(
+                    self.conn, key=xcffib.ExtensionKey("XINERAMA"))
+        if not self.reply(xinerama.IsActive()).state:
+            return []
+
+        screens = self.reply(xinerama.QueryScreens()).screen_info
+        return [(s.x_org, s.y_org, s.width, s.height) for s in screens]
+
+    def select_output_changes(self):
+        if self.randr is not None:
+            mask = xcffib.randr.NotifyMask.ScreenChange
+            if self.randr_version >= (1, 2):
+                mask |= xcffib.randr.NotifyMask.CrtcChange
+            self.randr.SelectInput(self.root, mask)
+            self.flush()
+
     def update_corners(self, wid, rad_top, rad_bot):
         if rad_top > 0 or rad_bot > 0:
-            dia_top = rad_top * 2 - 1 if rad_top > 0 else 0
-            dia_bot = rad_bot * 2 - 1 if rad_bot > 0 else 0
-            geometry = self.conn.core.GetGeometry(wid).reply()
-            width = geometry.width
-            height = geometry.height
+            geometry = self.get_geometry(wid)
+            key = (geometry.width, geometry.height, rad_top, rad_bot)
+            if self.shapes.get(wid) == key:
+                return
+            pixmap = self.get_shape_mask(*key)
+            self.get_shape_extension().Mask(
+                xcffib.shape.SO.Set, xcffib.shape.SK.Bounding, wid, 0, 0,
+                pixmap
+            )
+            self.shapes[wid] = key
+            self.flush()
+
+    def get_shape_extension(self):
+        if self.shape is None:
+            self.shape = xcffib.shape.shapeExtension(
+                        self.conn, key=xcffib.ExtensionKey("SHAPE"))
+        return self.shape
+
+    def get_shape_gcs(self):
+        if self.shape_gcs is None:
             pixmap = self.conn.generate_id()
-            self.conn.core.CreatePixmap(1, pixmap, wid, width, height)
+            self.conn.core.CreatePixmap(1, pixmap, self.root, 1, 1)
             black = self.conn.generate_id()
             white = self.conn.generate_id()
             self.conn.core.CreateGC(black, pixmap, xcffib.xproto.GC.Foreground,
                                     [self.default_screen.black_pixel])
             self.conn.core.CreateGC(white, pixmap, xcffib.xproto.GC.Foreground,
                                     [self.default_screen.white_pixel])
-            main_rect = [
-                xcffib.xproto.RECTANGLE.synthetic(0, 0, width, height)
-            ]
-            corner_rects = [
-                xcffib.xproto.RECTANGLE.synthetic(0, 0, rad_top, rad_top),
-                xcffib.xproto.RECTANGLE.synthetic(
-                        width - rad_top, 0, rad_top, rad_top),
-                xcffib.xproto.RECTANGLE.synthetic(
-                        0, height - rad_bot, rad_bot, rad_bot),
-                xcffib.xproto.RECTANGLE.synthetic(
-                        width - rad_bot, height - rad_bot, rad_bot, rad_bot)
-            ]
-            corner_arcs = [
-                xcffib.xproto.ARC.synthetic(
-                        -1, -1, dia_top, dia_top, 0, 360 << 6),
-                xcffib.xproto.ARC.synthetic(
-                        width - dia_top, -1, dia_top, dia_top, 0, 360 << 6),
-                xcffib.xproto.ARC.synthetic(
-                        -1, height - dia_bot, dia_bot, dia_bot, 0, 360 << 6),
-                xcffib.xproto.ARC.synthetic(
-                        width - dia_bot, height - dia_bot, dia_bot, dia_bot,
-                        0, 360 << 6)
-            ]
-            self.conn.core.PolyFillRectangle(pixmap, white, 1, main_rect)
-            self.conn.core.PolyFillRectangle(pixmap, black, 4, corner_rects)
-            self.conn.core.PolyFillArc(pixmap, white, 4, corner_arcs)
-            shape = xcffib.shape.shapeExtension(
-                        self.conn, key=xcffib.ExtensionKey("SHAPE"))
-            shape.Mask(xcffib.shape.SO.Set, xcffib.shape.SK.Bounding, wid, 0,
-                       0, pixmap)
             self.conn.core.FreePixmap(pixmap)
-            self.conn.flush()
+            self.shape_gcs = black, white
+        return self.shape_gcs
+
+    def get_shape_mask(self, width, height, rad_top, rad_bot):
+        key = (width, height, rad_top, rad_bot)
+        if key in self.shape_masks:
+            self.shape_masks[key] = self.shape_masks.pop(key)
+            return self.shape_masks[key]
+
+        if len(self.shape_masks) >= self.max_shape_masks:
+            oldest = next(iter(self.shape_masks))
+            self.conn.core.FreePixmap(self.shape_masks.pop(oldest))
+
+        dia_top = rad_top * 2 - 1 if rad_top > 0 else 0
+        dia_bot = rad_bot * 2 - 1 if rad_bot > 0 else 0
+        black, white = self.get_shape_gcs()
+        pixmap = self.conn.generate_id()
+        self.conn.core.CreatePixmap(1, pixmap, self.root, width, height)
+        main_rect = [
+            xcffib.xproto.RECTANGLE.synthetic(0, 0, width, height)
+        ]
+        corner_rects = [
+            xcffib.xproto.RECTANGLE.synthetic(0, 0, rad_top, rad_top),
+            xcffib.xproto.RECTANGLE.synthetic(
+                    width - rad_top, 0, rad_top, rad_top),
+            xcffib.xproto.RECTANGLE.synthetic(
+                    0, height - rad_bot, rad_bot, rad_bot),
+            xcffib.xproto.RECTANGLE.synthetic(
+                    width - rad_bot, height - rad_bot, rad_bot, rad_bot)
+        ]
+        corner_arcs = [
+            xcffib.xproto.ARC.synthetic(
+                    -1, -1, dia_top, dia_top, 0, 360 << 6),
+            xcffib.xproto.ARC.synthetic(
+                    width - dia_top, -1, dia_top, dia_top, 0, 360 << 6),
+            xcffib.xproto.ARC.synthetic(
+                    -1, height - dia_bot, dia_bot, dia_bot, 0, 360 << 6),
+            xcffib.xproto.ARC.synthetic(
+                    width - dia_bot, height - dia_bot, dia_bot, dia_bot,
+                    0, 360 << 6)
+        ]
+        self.conn.core.PolyFillRectangle(pixmap, white, 1, main_rect)
+        self.conn.core.PolyFillRectangle(pixmap, black, 4, corner_rects)
+        self.conn.core.PolyFillArc(pixmap, white, 4, corner_arcs)
+
+        self.shape_masks[key] = pixmap
+        return pixmap
 
     def set_border_color_white(self, wid):
         pixel = self.default_screen.white_pixel
         self.conn.core.ChangeWindowAttributes(wid, CW.BorderPixel, [pixel])
-        self.conn.flush()
+        self.flush()